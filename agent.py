@@ -0,0 +1,133 @@
+# agent.py
+# Lightweight scan agent. Runs the ARP and port scanners on the local network
+# segment and streams batched, gzip-compressed results to a central Spynet
+# server's /api/ingest endpoint:
+#
+#   sudo python agent.py --server http://central:5000 --network 10.1.0.0/24
+#   sudo python agent.py --server http://central:5000 --targets 127.0.0.1 --agent-id lab-1
+import argparse
+import gzip
+import json
+import os
+import socket
+import time
+from collections import deque
+import requests
+import arp_scanner
+from arp_scanner import arp_scan
+from port_scanner import iter_host_scans, set_scan_rate, set_connect_in_flight, ENGINES, DEFAULT_ENGINE
+from scheduler import PRIORITY_BACKGROUND
+from helper import ports_to_ranges
+
+# Batches kept for resending while the server is unreachable.
+MAX_BACKLOG = 100
+
+# Agents keep no database of their own: vendors are cached in memory and the
+# central server stores the results.
+arp_scanner.PERSIST_VENDORS = False
+
+
+class Agent:
+    def __init__(self, server, agent_id, token=None, batch_size=32, flush_interval=2.0):
+        self.url = server.rstrip('/') + '/api/ingest'
+        self.agent_id = agent_id
+        self.token = token
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.session = requests.Session()
+        self.backlog = deque(maxlen=MAX_BACKLOG)
+        self.reset_batch()
+
+    def reset_batch(self):
+        self.batch = {'arp': [], 'ports': [], 'networks': []}
+        self.batch_started = time.time()
+
+    def post(self, payload):
+        body = gzip.compress(json.dumps(payload).encode('utf-8'))
+        headers = {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        response = self.session.post(self.url, data=body, headers=headers, timeout=10)
+        response.raise_for_status()
+
+    def flush(self):
+        """
+        Sends the current batch (and any backlog from earlier failures).
+        """
+        if self.batch['arp'] or self.batch['ports'] or self.batch['networks']:
+            self.backlog.append(dict(self.batch, agent=self.agent_id, sent_at=time.time()))
+            self.reset_batch()
+        while self.backlog:
+            try:
+                self.post(self.backlog[0])
+            except requests.RequestException as e:
+                print(f"[-] Could not reach {self.url}: {e}; {len(self.backlog)} batches queued")
+                return
+            self.backlog.popleft()
+
+    def add(self, key, item):
+        self.batch[key].append(item)
+        if (len(self.batch['arp']) + len(self.batch['ports']) >= self.batch_size
+                or time.time() - self.batch_started >= self.flush_interval):
+            self.flush()
+
+    def run_once(self, networks, targets, port_range, timeout, hosts_in_flight=16, engine=None):
+        live_ips = list(targets)
+        for network in networks:
+            live_hosts = arp_scan(network, timeout=timeout)
+            print(f"[+] ARP scan of {network} found {len(live_hosts)} hosts")
+            for host in live_hosts:
+                self.add('arp', host)
+            # Lets the server mark hosts of this network that did not answer as offline.
+            self.batch['networks'].append({'network': network, 'live': [h['ip'] for h in live_hosts]})
+            live_ips.extend(h['ip'] for h in live_hosts)
+        self.flush()
+
+        ports = list(range(port_range[0], port_range[1] + 1))
+        plans = {ip: ports for ip in dict.fromkeys(live_ips)}
+        for ip, open_ports, complete in iter_host_scans(plans, timeout=timeout, priority=PRIORITY_BACKGROUND,
+                                                        in_flight=hosts_in_flight, engine=engine):
+            scanned = ports if complete else open_ports
+            self.add('ports', {'ip': ip, 'scanned': ports_to_ranges(scanned), 'open': open_ports})
+        self.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spynet remote scan agent")
+    parser.add_argument('--server', required=True, help="central server URL, e.g. http://10.0.0.5:5000")
+    parser.add_argument('--network', default="", help="CIDRs to ARP scan, comma-separated")
+    parser.add_argument('--targets', default="", help="IPs to port scan without ARP discovery, comma-separated")
+    parser.add_argument('--ports', default="1-1024", help="port range, e.g. 1-1024")
+    parser.add_argument('--timeout', type=float, default=2)
+    parser.add_argument('--interval', type=int, default=60, help="seconds between scan cycles")
+    parser.add_argument('--rate', type=int, default=10000, help="probes per second")
+    parser.add_argument('--engine', choices=list(ENGINES), default=DEFAULT_ENGINE,
+                        help="port scan engine; 'connect' needs no root (default: syn as root, else connect)")
+    parser.add_argument('--max-in-flight', type=int, default=0, help="open connection attempts for --engine connect")
+    parser.add_argument('--agent-id', default=socket.gethostname())
+    parser.add_argument('--token', default=os.environ.get('SPYNET_AGENT_TOKEN'))
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--once', action='store_true', help="run a single cycle and exit")
+    args = parser.parse_args()
+
+    networks = [n.strip() for n in args.network.split(',') if n.strip()]
+    targets = [t.strip() for t in args.targets.split(',') if t.strip()]
+    if not networks and not targets:
+        parser.error("give --network and/or --targets")
+    start, _, end = args.ports.partition('-')
+    port_range = (int(start), int(end or start))
+
+    set_scan_rate(args.rate)
+    if args.max_in_flight:
+        set_connect_in_flight(args.max_in_flight)
+    agent = Agent(args.server, args.agent_id, args.token, args.batch_size)
+    print(f"[+] Agent {args.agent_id} reporting to {agent.url}")
+    while True:
+        agent.run_once(networks, targets, port_range, args.timeout, engine=args.engine)
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
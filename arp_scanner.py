@@ -1,33 +1,263 @@
 # arp_scanner.py
-from scapy.all import ARP, Ether, srp
+import ipaddress
+import os
+import queue
+import select
+import threading
+import time
+from datetime import datetime
+# Only the layers used here; scapy.all takes several times longer to import.
+from scapy.config import conf
+from scapy.data import ETH_P_ARP
+from scapy.layers.l2 import ARP, Ether
 import requests
+from oui import OuiDatabase
+from congestion import RateLimiter, host_conditions
+from metrics import ARP_REQUESTS_SENT, ARP_REPLIES, VENDOR_LOOKUP_SECONDS
 
-# Simple in-memory cache for MAC vendor lookups
+# Query api.macvendors.com in the background for MACs missing from the local
+# IEEE registry. Disable with SPYNET_VENDOR_API=0 (e.g. on air-gapped hosts).
+REMOTE_LOOKUP = os.environ.get('SPYNET_VENDOR_API', '1') != '0'
+REMOTE_INTERVAL = 1.0  # seconds between API calls (free tier rate limit)
+
+# ARP requests per second during a sweep. Requests go out in chunks of
+# ARP_CHUNK, and replies that arrived meanwhile are handed out between chunks.
+ARP_RATE = 2000
+ARP_CHUNK = 64
+# Rounds of requests re-sent to hosts that have not answered yet, so a lost
+# request or reply does not hide a host until the next sweep.
+ARP_RETRIES = 1
+
+# Newly resolved vendors are written to the database in batches of this
+# size, and whatever is left at the end of each sweep.
+VENDOR_FLUSH_SIZE = 64
+# MACs the API could not resolve are not queued again for this many seconds.
+UNKNOWN_TTL = 6 * 3600
+
+# Keep resolved vendors in the database's vendor_cache table. Scan agents
+# set this to False: they keep the cache in memory and never create a
+# database. The database modules are only imported when this is True.
+PERSIST_VENDORS = True
+
+# In-memory view of the persistent vendor cache, filled on first use.
 vendor_cache = {}
+vendor_cache_loaded = False
+unsaved_vendors = {}  # mac -> VendorCache row not yet written
+unknown_until = {}  # mac -> time.monotonic() before which the API is not asked again
+cache_lock = threading.Lock()
+oui_db = OuiDatabase()
+remote_queue = queue.Queue()
+remote_pending = set()
+remote_thread = None
+vendor_listeners = []  # callables(mac, vendor) run when a background lookup resolves
+
+def add_vendor_listener(callback):
+    vendor_listeners.append(callback)
+
+def _load_cache():
+    global vendor_cache_loaded
+    vendor_cache_loaded = True
+    if not PERSIST_VENDORS:
+        return
+    from models import VendorCache
+    from db import session_scope
+    with session_scope() as session:
+        for row in session.query(VendorCache).all():
+            vendor_cache[row.mac] = row.vendor
+
+def _store(mac, vendor, source):
+    # Called with cache_lock held; the row is written by flush_vendor_cache.
+    vendor_cache[mac] = vendor
+    unsaved_vendors[mac] = {'mac': mac, 'vendor': vendor, 'source': source, 'updated': datetime.utcnow()}
+
+def flush_vendor_cache():
+    """
+    Writes the vendors resolved since the last flush in one transaction.
+    """
+    with cache_lock:
+        rows = list(unsaved_vendors.values())
+        unsaved_vendors.clear()
+    if not rows or not PERSIST_VENDORS:
+        return
+    from db import save_vendors
+    try:
+        save_vendors(rows)
+    except Exception as e:
+        print(f"[-] Could not store {len(rows)} MAC vendors: {e}")
 
-def lookup_vendor(mac):
-    if mac in vendor_cache:
-        return vendor_cache[mac]
+def remote_lookup(mac):
+    """
+    Looks mac up on api.macvendors.com. Returns the vendor or None.
+    """
     try:
-        # Using the macvendors.com API for vendor lookup
         response = requests.get(f"https://api.macvendors.com/{mac}", timeout=5)
-        vendor = response.text.strip() if response.status_code == 200 else "Unknown"
+        if response.status_code == 200:
+            return response.text.strip()
     except Exception:
-        vendor = "Unknown"
-    vendor_cache[mac] = vendor
+        pass
+    return None
+
+def _remote_worker():
+    while True:
+        mac = remote_queue.get()
+        vendor = remote_lookup(mac)
+        with cache_lock:
+            remote_pending.discard(mac)
+            if vendor:
+                _store(mac, vendor, "api")
+            else:
+                unknown_until[mac] = time.monotonic() + UNKNOWN_TTL
+        if vendor and (remote_queue.empty() or len(unsaved_vendors) >= VENDOR_FLUSH_SIZE):
+            flush_vendor_cache()
+        if vendor:
+            for callback in vendor_listeners:
+                try:
+                    callback(mac, vendor)
+                except Exception as e:
+                    print(f"[-] Vendor listener failed: {e}")
+        time.sleep(REMOTE_INTERVAL)
+
+def _queue_remote(mac):
+    global remote_thread
+    if mac in remote_pending:
+        return
+    remote_pending.add(mac)
+    if remote_thread is None:
+        remote_thread = threading.Thread(target=_remote_worker, daemon=True)
+        remote_thread.start()
+    remote_queue.put(mac)
+
+def lookup_vendor(mac, remote=False):
+    """
+    Resolves the vendor for mac from the persistent cache or the local IEEE
+    registry. Unknown MACs are queued for a background API lookup, unless
+    the API failed to resolve them within UNKNOWN_TTL; pass remote=True to
+    query the API synchronously instead.
+    """
+    start = time.perf_counter()
+    vendor, source = _resolve_vendor(mac.lower(), remote)
+    VENDOR_LOOKUP_SECONDS.labels(source).observe(time.perf_counter() - start)
+    if source == "api" or len(unsaved_vendors) >= VENDOR_FLUSH_SIZE:
+        flush_vendor_cache()
     return vendor
 
+def _resolve_vendor(mac, remote):
+    # Returns (vendor, source) where source names the tier that answered.
+    with cache_lock:
+        if not vendor_cache_loaded:
+            _load_cache()
+        vendor = vendor_cache.get(mac)
+        if vendor:
+            return vendor, "cache"
+        vendor = oui_db.lookup(mac)
+        if vendor:
+            _store(mac, vendor, "ieee")
+            return vendor, "ieee"
+        if REMOTE_LOOKUP and not remote and unknown_until.get(mac, 0) <= time.monotonic():
+            _queue_remote(mac)
+    if REMOTE_LOOKUP and remote:
+        vendor = remote_lookup(mac)
+        with cache_lock:
+            if vendor:
+                _store(mac, vendor, "api")
+                return vendor, "api"
+            unknown_until[mac] = time.monotonic() + UNKNOWN_TTL
+    return "Unknown", "unknown"
+
+class ScapyArpTransport:
+    """
+    Sends ARP requests and reads ARP replies on one layer 2 socket, bound
+    to the interface that routes to the network. Requires root.
+    """
+    def __init__(self, network):
+        net = ipaddress.ip_network(network, strict=False)
+        iface = conf.route.route(str(net.network_address))[0]
+        self.sock = conf.L2socket(iface=iface, type=ETH_P_ARP)
+
+    def send(self, ip):
+        self.sock.send(Ether(dst="ff:ff:ff:ff:ff:ff")/ARP(pdst=ip))
+
+    def recv(self, timeout):
+        """
+        Returns (ip, mac, arrival time) for the next ARP reply, or None if
+        none arrived within timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            ready, _, _ = select.select([self.sock], [], [], max(0, deadline - time.monotonic()))
+            if not ready:
+                return None
+            packet = self.sock.recv()
+            if packet is not None and ARP in packet and packet[ARP].op == 2:
+                return packet[ARP].psrc, packet[ARP].hwsrc, packet.time
+            if time.monotonic() >= deadline:
+                return None
+
+    def close(self):
+        self.sock.close()
+
+# Opens the transport for one sweep; the benchmark swaps in a simulated network.
+open_arp_transport = ScapyArpTransport
+
+def iter_arp_scan(network, timeout=2, rate=ARP_RATE, retries=ARP_RETRIES):
+    """
+    Sweeps the given network (CIDR notation) with ARP and yields a dictionary
+    with 'ip', 'mac' and 'vendor' for each live host as soon as it answers.
+    Requests are sent in rate-limited chunks; each round then waits for
+    replies and the next round only asks the hosts that stayed silent.
+    timeout is an upper bound on that wait: once reply times are known it is
+    derived from them. Hosts still silent are asked again in up to retries
+    more rounds.
+    """
+    targets = [str(ip) for ip in ipaddress.ip_network(network, strict=False).hosts()]
+    wait = host_conditions.network_timeout(timeout)
+    limiter = RateLimiter(rate)
+    sent_at = {}      # ip -> time of the first request
+    retried = set()   # replies to these give no RTT sample (Karn's rule)
+    answered = set()
+    transport = open_arp_transport(network)
+
+    def collect(duration):
+        # Yields replies until duration has passed; 0 takes only those already in.
+        deadline = time.monotonic() + duration
+        while True:
+            reply = transport.recv(max(0, deadline - time.monotonic()))
+            if reply is None:
+                return
+            ip, mac, arrived = reply
+            if ip in answered or ip not in sent_at:
+                continue
+            answered.add(ip)
+            ARP_REPLIES.inc()
+            if ip not in retried:
+                host_conditions.record_rtt(ip, arrived - sent_at[ip])
+            yield {'ip': ip, 'mac': mac, 'vendor': lookup_vendor(mac)}
+
+    try:
+        for _ in range(retries + 1):
+            pending = [ip for ip in targets if ip not in answered]
+            if not pending:
+                break
+            for i in range(0, len(pending), ARP_CHUNK):
+                chunk = pending[i:i + ARP_CHUNK]
+                for ip in chunk:
+                    limiter.acquire()
+                    if ip in sent_at:
+                        retried.add(ip)
+                    else:
+                        sent_at[ip] = time.time()
+                    transport.send(ip)
+                ARP_REQUESTS_SENT.inc(len(chunk))
+                yield from collect(0)
+            yield from collect(wait)
+    finally:
+        transport.close()
+        flush_vendor_cache()
+
 def arp_scan(network, timeout=2):
     """
     Scans the given network (CIDR notation, e.g. '192.168.1.0/24') using ARP.
-    Returns a list of dictionaries with 'ip' and 'mac' for live hosts.
-    """
-    # Create an Ethernet frame (broadcast) and ARP request
-    ans, _ = srp(Ether(dst="ff:ff:ff:ff:ff:ff")/ARP(pdst=network),
-                 timeout=timeout, verbose=0)
-    live_hosts = []
-    for snd, rcv in ans:
-        host = {'ip': rcv.psrc, 'mac': rcv.hwsrc}
-        host['vendor'] = lookup_vendor(rcv.hwsrc)
-        live_hosts.append(host)
-    return live_hosts
+    Returns a list of dictionaries with 'ip', 'mac' and 'vendor' for live
+    hosts once the sweep has finished; see iter_arp_scan.
+    """
+    return list(iter_arp_scan(network, timeout=timeout))
@@ -0,0 +1,112 @@
+# bench/common.py
+# Setup, sampling and reporting shared by the benchmarks.
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+
+
+def isolate(prefix, db_name):
+    """
+    Points Spynet at a fresh database in a new temporary directory and turns
+    off remote vendor lookups. Must run before db is imported. Returns the
+    directory.
+    """
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    os.environ['SPYNET_DB_URL'] = f"sqlite:///{os.path.join(workdir, db_name)}"
+    os.environ['SPYNET_VENDOR_API'] = '0'
+    os.environ.setdefault('SPYNET_OUI_DIR', workdir)
+    return workdir
+
+
+class ThreadSampler:
+    """
+    Records the peak number of live threads while a scenario runs.
+    """
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def recall(net, found):
+    """
+    Fraction of truly open ports (within the scanned range) that were found.
+    """
+    expected = sum(len(ports) for ports in net.values())
+    hit = sum(len(set(found.get(ip, [])) & ports) for ip, ports in net.items())
+    return hit / expected if expected else 1.0
+
+
+def add_report_arguments(parser):
+    parser.add_argument('--save', help="write the report as JSON to this file")
+    parser.add_argument('--baseline', help="compare against a saved report and fail on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+
+
+def report_config(args):
+    """
+    The benchmark's arguments as recorded in its report.
+    """
+    return {k: v for k, v in vars(args).items() if k not in ('save', 'baseline')}
+
+
+def compare(report, baseline, tolerance, checks):
+    """
+    Returns a list of regressions of report against baseline. checks are
+    (section, key, direction): direction 1 means higher is worse, -1 lower
+    is worse. section None reads key at the top level; for a section that
+    holds a list of runs the last run is compared.
+    """
+    problems = []
+    for section, key, direction in checks:
+        old = baseline.get(section) if section else baseline
+        new = report.get(section) if section else report
+        if not old or not new:
+            continue
+        if isinstance(old, list):
+            old, new = old[-1], new[-1]
+        if key not in old or key not in new:
+            continue
+        name = f"{section}.{key}" if section else key
+        if direction > 0 and new[key] > old[key] * (1 + tolerance):
+            problems.append(f"{name}: {new[key]} vs baseline {old[key]}")
+        if direction < 0 and new[key] < old[key] * (1 - tolerance):
+            problems.append(f"{name}: {new[key]} vs baseline {old[key]}")
+    return problems
+
+
+def finish(report, args, checks):
+    """
+    Prints the report, saves it with --save and, with --baseline, exits
+    non-zero if any of checks regressed beyond --tolerance.
+    """
+    print(json.dumps(report, indent=2))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(report, json.load(f), args.tolerance, checks)
+        for problem in problems:
+            print(f"[-] Regression: {problem}")
+        sys.exit(1 if problems else 0)
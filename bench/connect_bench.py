@@ -0,0 +1,98 @@
+# bench/connect_bench.py
+# Connect-scan engine benchmark against listeners on loopback; no root needed.
+#
+#   python -m bench.connect_bench --hosts 4 --ports 1-20000 --listeners 50
+#   python -m bench.connect_bench --max-in-flight 4096 --rate 0 --save connect.json
+#   python -m bench.connect_bench --baseline connect.json --tolerance 0.2
+import argparse
+import random
+import socket
+import time
+from bench.common import (ThreadSampler, add_report_arguments, finish, isolate, peak_rss_mb, recall,
+                          report_config)
+
+CHECKS = [('connect_scan', 'scan_time_s', 1), ('connect_scan', 'port_recall', -1)]
+
+
+def open_listeners(hosts, port_range, per_host, seed):
+    """
+    Listens on per_host random ports of each loopback address. Returns
+    (sockets, ip -> set of listening ports).
+    """
+    rng = random.Random(seed)
+    sockets, truth = [], {}
+    for ip in hosts:
+        truth[ip] = set()
+        candidates = rng.sample(range(port_range[0], port_range[1] + 1),
+                                min(per_host * 2, port_range[1] - port_range[0] + 1))
+        for port in candidates:
+            if len(truth[ip]) == per_host:
+                break
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                sock.bind((ip, port))
+            except OSError:
+                sock.close()
+                continue
+            sock.listen(1024)
+            sockets.append(sock)
+            truth[ip].add(port)
+    return sockets, truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spynet connect-scan benchmark on loopback")
+    parser.add_argument('--hosts', type=int, default=2, help="loopback addresses to scan (127.0.0.1 and up)")
+    parser.add_argument('--ports', default='1-10000')
+    parser.add_argument('--listeners', type=int, default=50, help="listening ports per host")
+    parser.add_argument('--max-in-flight', type=int, default=1024)
+    parser.add_argument('--rate', type=int, default=50000, help="connection attempts per second (0: unlimited)")
+    parser.add_argument('--timeout', type=float, default=1.0)
+    parser.add_argument('--runs', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    add_report_arguments(parser)
+    args = parser.parse_args()
+    start, _, end = args.ports.partition('-')
+    port_range = (int(start), int(end or start))
+
+    isolate('spynet-bench-', 'bench.db')
+
+    import port_scanner
+    from metrics import CONNECT_PROBES
+
+    port_scanner.set_scan_rate(args.rate)
+    port_scanner.set_connect_in_flight(args.max_in_flight)
+    hosts = [f"127.0.0.{i + 1}" for i in range(args.hosts)]
+    sockets, truth = open_listeners(hosts, port_range, args.listeners, args.seed)
+    ports = list(range(port_range[0], port_range[1] + 1))
+    results = []
+    try:
+        for _ in range(args.runs):
+            sent_before = sum(child.value for child in CONNECT_PROBES.children.values())
+            with ThreadSampler() as threads:
+                started = time.perf_counter()
+                found = port_scanner.scan_hosts({ip: ports for ip in hosts}, timeout=args.timeout, engine='connect')
+                duration = time.perf_counter() - started
+            probes = sum(child.value for child in CONNECT_PROBES.children.values()) - sent_before
+            results.append({
+                'scan_time_s': round(duration, 3),
+                'probes': int(probes),
+                'probes_per_s': round(probes / duration, 1),
+                'port_recall': round(recall(truth, found), 4),
+                'unexpected_open': sum(len(set(found[ip]) - truth[ip]) for ip in hosts),
+                'peak_threads': threads.peak,
+                'peak_rss_mb': round(peak_rss_mb(), 1),
+            })
+    finally:
+        for sock in sockets:
+            sock.close()
+
+    report = {
+        'config': report_config(args),
+        'connect_scan': results,
+    }
+    finish(report, args, CHECKS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+# bench/run_bench.py
+# Scanner benchmark against a simulated network; no root or real hardware needed.
+#
+#   python -m bench.run_bench --hosts 100 --ports 1-1024 --latency 0.005 --loss 0.01
+#   python -m bench.run_bench --save baseline.json
+#   python -m bench.run_bench --baseline baseline.json --tolerance 0.2
+import argparse
+import time
+from bench.common import (ThreadSampler, add_report_arguments, finish, isolate, peak_rss_mb, recall,
+                          report_config)
+
+CHECKS = [('scan_once', 'cycle_time_s', 1), ('api_portscan', 'latency_s', 1),
+          ('scan_once', 'port_recall', -1), ('api_portscan', 'port_recall', -1)]
+
+
+def timed(fn, bucket):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            bucket.append(time.perf_counter() - start)
+    return wrapper
+
+
+def bench_scan_once(sim, network_scanner, args):
+    import scanner
+    db_times = []
+    scanner.upsert_arp_results = timed(scanner.upsert_arp_results, db_times)
+    scanner.save_port_results = timed(scanner.save_port_results, db_times)
+
+    sc = network_scanner
+    sc.networks = [args.subnet]
+    sc.port_range = args.port_range
+    sc.timeout = args.timeout
+    sc.hosts_in_flight = args.hosts_in_flight
+    # The simulated network only carries the SYN engine's packets; without
+    # root the default engine would send real connect() calls instead.
+    sc.engine = 'syn'
+    results = []
+    for _ in range(args.cycles):
+        sent_before = sim.sent
+        db_times.clear()
+        with ThreadSampler() as threads:
+            start = time.perf_counter()
+            sc.scan_once()
+            duration = time.perf_counter() - start
+        data = sc.get_data()
+        truth = {ip: {p for p in h.open_ports if args.port_range[0] <= p <= args.port_range[1]}
+                 for ip, h in sim.hosts.items()}
+        results.append({
+            'cycle_time_s': round(duration, 3),
+            'packets_sent': sim.sent - sent_before,
+            'packets_per_s': round((sim.sent - sent_before) / duration, 1),
+            'peak_threads': threads.peak,
+            'db_write_s': round(sum(db_times), 4),
+            'hosts_found': sum(1 for ip in sim.hosts if ip in data),
+            'port_recall': round(recall(truth, {ip: data[ip]['ports'] for ip in data}), 4),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        })
+    return results
+
+
+def bench_api_portscan(sim, server_module, args):
+    client = server_module.app.test_client()
+    scanner = server_module.scanner
+    ip = sorted(sim.hosts)[0]
+    ports = (1, 65535) if args.api_scan == 'all' else args.port_range
+    payload = {'host': ip, 'scan_type': 'range', 'start_port': ports[0], 'end_port': ports[1],
+               'timeout': args.timeout, 'engine': 'syn'}
+    if args.api_scan == 'all':
+        payload = {'host': ip, 'scan_type': 'all', 'timeout': args.timeout, 'engine': 'syn'}
+    sent_before = sim.sent
+    with ThreadSampler() as threads:
+        start = time.perf_counter()
+        response = client.post('/api/command/portscan', json=payload)
+        # Wait for the placeholder flag to be set, then for the scan to finish.
+        time.sleep(0.05)
+        deadline = time.time() + args.api_deadline
+        while time.time() < deadline:
+            host = scanner.get_host(ip) or {}
+            if not host.get('port_scan_in_progress'):
+                break
+            time.sleep(0.01)
+        duration = time.perf_counter() - start
+    truth = {ip: {p for p in sim.hosts[ip].open_ports if ports[0] <= p <= ports[1]}}
+    return {
+        'status_code': response.status_code,
+        'latency_s': round(duration, 3),
+        'packets_sent': sim.sent - sent_before,
+        'packets_per_s': round((sim.sent - sent_before) / duration, 1),
+        'peak_threads': threads.peak,
+        'port_recall': round(recall(truth, {ip: (scanner.get_host(ip) or {}).get('ports', [])}), 4),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spynet scanner benchmark on a simulated network")
+    parser.add_argument('--subnet', default='10.99.0.0/24')
+    parser.add_argument('--hosts', type=int, default=50)
+    parser.add_argument('--ports', default='1-1024')
+    parser.add_argument('--density', type=float, default=0.01, help="fraction of ports open per host")
+    parser.add_argument('--latency', type=float, default=0.002, help="one-way latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0005)
+    parser.add_argument('--loss', type=float, default=0.0, help="probability a packet is dropped")
+    parser.add_argument('--rate', type=int, default=50000, help="SYN probes per second")
+    parser.add_argument('--timeout', type=float, default=1.0)
+    parser.add_argument('--hosts-in-flight', type=int, default=16)
+    parser.add_argument('--cycles', type=int, default=2)
+    parser.add_argument('--api-scan', choices=['range', 'all'], default='range')
+    parser.add_argument('--api-deadline', type=float, default=120)
+    parser.add_argument('--seed', type=int, default=1)
+    add_report_arguments(parser)
+    args = parser.parse_args()
+    start, _, end = args.ports.partition('-')
+    args.port_range = (int(start), int(end or start))
+
+    isolate('spynet-bench-', 'bench.db')
+
+    from bench.simnet import SimulatedNetwork
+    import port_scanner
+    import server
+
+    sim = SimulatedNetwork(args.subnet, args.hosts, args.port_range, args.density,
+                           args.latency, args.jitter, args.loss, args.seed)
+    sim.install()
+    port_scanner.set_scan_rate(args.rate)
+
+    report = {
+        'config': report_config(args),
+        'scan_once': bench_scan_once(sim, server.scanner, args),
+        'api_portscan': bench_api_portscan(sim, server, args),
+    }
+    finish(report, args, CHECKS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+# bench/simnet.py
+import heapq
+import ipaddress
+import random
+import socket
+import struct
+import threading
+import time
+from syn_engine import TCP_SYN, TCP_RST, TCP_ACK
+
+COMMON_PORTS = [22, 80, 443, 445, 3389, 8080]
+
+
+class SimHost:
+    __slots__ = ('ip', 'mac', 'open_ports')
+
+    def __init__(self, ip, mac, open_ports):
+        self.ip = ip
+        self.mac = mac
+        self.open_ports = open_ports
+
+
+class _SimArpTransport:
+    """
+    ARP side of the simulated network, for one sweep.
+    """
+    def __init__(self, net):
+        self.net = net
+        self.cond = threading.Condition()
+        self.inbox = []  # heap of (deliver_at, ip, mac)
+
+    def send(self, ip):
+        net = self.net
+        with net.lock:
+            net.sent += 1
+            host = net.hosts.get(ip)
+            if host is None or net._lost() or net._lost():
+                return
+            deliver_at = time.monotonic() + 2 * net._delay()
+        with self.cond:
+            heapq.heappush(self.inbox, (deliver_at, ip, host.mac))
+            self.cond.notify()
+
+    def recv(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                if self.inbox and self.inbox[0][0] <= now:
+                    _, ip, mac = heapq.heappop(self.inbox)
+                    self.net.replied += 1
+                    return ip, mac, time.time()
+                if now >= deadline:
+                    return None
+                wake = self.inbox[0][0] if self.inbox else deadline
+                self.cond.wait(min(wake, deadline) - now)
+
+    def close(self):
+        pass
+
+
+class SimulatedNetwork:
+    """
+    A fake network of hosts with configurable density of open ports,
+    one-way latency (plus jitter) and packet loss. It replaces the raw
+    socket transports of the SYN engine and the ARP sweep.
+    """
+    def __init__(self, subnet='10.99.0.0/24', hosts=50, port_range=(1, 1024), open_density=0.01,
+                 latency=0.002, jitter=0.0005, loss=0.0, seed=1):
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.subnet = ipaddress.ip_network(subnet)
+        addresses = list(self.subnet.hosts())
+        self.hosts = {}
+        for addr in self.rng.sample(addresses, min(hosts, len(addresses))):
+            ip = str(addr)
+            mac = "02:00:%02x:%02x:%02x:%02x" % tuple(addr.packed)
+            count = max(1, int((port_range[1] - port_range[0] + 1) * open_density))
+            ports = {self.rng.randint(*port_range) for _ in range(count)}
+            ports.update(p for p in COMMON_PORTS if self.rng.random() < 0.3)
+            self.hosts[ip] = SimHost(ip, mac, ports)
+        self.lock = threading.Lock()
+        self.inbox = []  # heap of (deliver_at, seq, packet)
+        self.seq = 0
+        self.arrived = threading.Condition(self.lock)
+        self.sent = 0
+        self.replied = 0
+
+    def _delay(self):
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def _lost(self):
+        return self.loss and self.rng.random() < self.loss
+
+    # SYN engine transport interface
+
+    def source_for(self, dst):
+        return '10.99.255.254'
+
+    def send(self, dst, segment):
+        sport, dport, seq, _, _, flags = struct.unpack("!HHIIBB", segment[:14])
+        with self.lock:
+            self.sent += 1
+            host = self.hosts.get(dst)
+            # The probe and the reply can each be lost.
+            if host is None or flags != TCP_SYN or self._lost() or self._lost():
+                return
+            reply_flags = TCP_SYN | TCP_ACK if dport in host.open_ports else TCP_RST | TCP_ACK
+            ip_header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 40, 0, 0, 64, socket.IPPROTO_TCP, 0,
+                                    socket.inet_aton(dst), socket.inet_aton(self.source_for(dst)))
+            tcp = struct.pack("!HHIIBBHHH", dport, sport, 0, (seq + 1) & 0xFFFFFFFF, 5 << 4, reply_flags, 0, 0, 0)
+            self.seq += 1
+            heapq.heappush(self.inbox, (time.monotonic() + 2 * self._delay(), self.seq, ip_header + tcp))
+            self.arrived.notify()
+
+    def recv(self, poll_interval=0.2):
+        deadline = time.monotonic() + poll_interval
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                if self.inbox and self.inbox[0][0] <= now:
+                    self.replied += 1
+                    return heapq.heappop(self.inbox)[2]
+                if now >= deadline:
+                    return None
+                wake = self.inbox[0][0] if self.inbox else deadline
+                self.arrived.wait(min(wake, deadline) - now)
+
+    def install(self):
+        """
+        Routes the scanners' packet I/O through this network.
+        """
+        import arp_scanner
+        import port_scanner
+        port_scanner.engine.transport = self
+        arp_scanner.open_arp_transport = lambda network: _SimArpTransport(self)
@@ -0,0 +1,97 @@
+# bench/startup.py
+# Server startup benchmark: how long until / and /api/scan answer, and until
+# every stored host is in memory, against a database seeded with --hosts.
+#
+#   python -m bench.startup --hosts 20000 --runs 5
+#   python -m bench.startup --save startup.json
+#   python -m bench.startup --baseline startup.json --tolerance 0.2
+import argparse
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+from bench.common import add_report_arguments, finish, isolate
+
+CHECKS = [(None, 'import_s', 1), (None, 'scan_s', 1), (None, 'hosts_loaded_s', 1)]
+
+
+def seed(hosts, ports_per_host):
+    """
+    Fills the database named by SPYNET_DB_URL with hosts and open ports.
+    """
+    from datetime import datetime
+    from db import upsert_arp_results, save_port_results
+    rng = random.Random(1)
+    live = []
+    for i in range(hosts):
+        ip = f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+        live.append({'ip': ip, 'mac': f"02:00:00:{(i >> 16) & 255:02x}:{(i >> 8) & 255:02x}:{i & 255:02x}",
+                     'vendor': "Unknown"})
+    upsert_arp_results(live, datetime.utcnow())
+    save_port_results({h['ip']: ([], rng.sample(range(1, 1025), ports_per_host)) for h in live})
+
+
+def probe(launched):
+    """
+    Runs in a fresh interpreter: imports the server, requests / and
+    /api/scan, then waits for the host load. Prints one JSON line of
+    seconds since launched (the parent's time.time() before starting us).
+    """
+    since = lambda: round(time.time() - launched, 4)
+    imported_at = time.perf_counter()
+    import server
+    import_s = time.perf_counter() - imported_at
+    result = {'ready_s': since(), 'import_s': round(import_s, 4)}
+    client = server.app.test_client()
+    result['index_status'] = client.get('/').status_code
+    result['index_s'] = since()
+    response = client.get('/api/scan')
+    result['scan_status'] = response.status_code
+    result['scan_s'] = since()
+    result['hosts_at_first_scan'] = len(response.get_json() or {})
+    server.scanner.loaded.wait()
+    result['hosts_loaded_s'] = since()
+    result['hosts_loaded'] = len(server.scanner.get_data())
+    result['scapy_all_imported'] = 'scapy.all' in sys.modules
+    print(json.dumps(result))
+
+
+def run(runs):
+    samples = []
+    for _ in range(runs):
+        launched = time.time()
+        out = subprocess.run([sys.executable, '-m', 'bench.startup', '--probe', repr(launched)],
+                             capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    report = {key: round(statistics.median(s[key] for s in samples), 4)
+              for key in ('import_s', 'ready_s', 'index_s', 'scan_s', 'hosts_loaded_s')}
+    last = samples[-1]
+    for key in ('index_status', 'scan_status', 'hosts_at_first_scan', 'hosts_loaded', 'scapy_all_imported'):
+        report[key] = last[key]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spynet server startup benchmark")
+    parser.add_argument('--hosts', type=int, default=5000, help="hosts stored in the database")
+    parser.add_argument('--ports-per-host', type=int, default=5)
+    parser.add_argument('--runs', type=int, default=5, help="startups to take the median of")
+    add_report_arguments(parser)
+    parser.add_argument('--probe', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.probe is not None:
+        probe(args.probe)
+        return
+
+    isolate('spynet-startup-', 'startup.db')
+    seed(args.hosts, args.ports_per_host)
+
+    report = {'config': {'hosts': args.hosts, 'ports_per_host': args.ports_per_host, 'runs': args.runs}}
+    report.update(run(args.runs))
+    finish(report, args, CHECKS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+# congestion.py
+import threading
+import time
+
+# Bounds for adaptive timeouts, in seconds. The configured scan timeout is the
+# upper bound and is also used for hosts without RTT samples yet.
+MIN_TIMEOUT = 0.1
+# A host that keeps dropping replies is never paced below this many probes/s.
+MIN_HOST_RATE = 50
+# Rate assumed when backing off from an unlimited global budget.
+DEFAULT_RATE = 10000
+
+
+class RateLimiter:
+    """
+    Token bucket limiting how many packets per second may be sent.
+    A rate of 0 (or None) disables limiting.
+    """
+    def __init__(self, rate, burst=None):
+        self.lock = threading.Lock()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        with self.lock:
+            self.rate = float(rate or 0)
+            self.burst = float(burst or max(1.0, self.rate / 10))
+            self.tokens = self.burst
+            self.stamp = time.monotonic()
+
+    def acquire(self, n=1):
+        """
+        Blocks until n tokens are available.
+        """
+        while True:
+            with self.lock:
+                if self.rate <= 0:
+                    return
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def take(self, n=1):
+        """
+        Takes n tokens without blocking. Returns 0 if they were taken, or
+        else the seconds to wait before they will be available.
+        """
+        with self.lock:
+            if self.rate <= 0:
+                return 0
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens >= n:
+                self.tokens -= n
+                return 0
+            return (n - self.tokens) / self.rate
+
+
+class HostState:
+    """
+    RTT estimate (RFC 6298 SRTT/RTTVAR) and send-rate cap for one host.
+    """
+    __slots__ = ('srtt', 'rttvar', 'rate', 'limiter')
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.rate = None  # probes per second; None means only the global budget applies
+        self.limiter = None
+
+
+class HostConditions:
+    """
+    Per-host network conditions shared by the ARP and SYN scanners:
+    measured RTTs, derived timeouts and per-host send rates that back off
+    multiplicatively on loss and recover on loss-free rounds.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def _state(self, ip):
+        state = self.hosts.get(ip)
+        if state is None:
+            state = self.hosts[ip] = HostState()
+        return state
+
+    def record_rtt(self, ip, sample):
+        with self.lock:
+            state = self._state(ip)
+            if state.srtt is None:
+                state.srtt = sample
+                state.rttvar = sample / 2
+            else:
+                state.rttvar = 0.75 * state.rttvar + 0.25 * abs(state.srtt - sample)
+                state.srtt = 0.875 * state.srtt + 0.125 * sample
+
+    def timeout_for(self, ip, ceiling):
+        """
+        Returns how long to wait for replies from ip, at most ceiling.
+        """
+        state = self.hosts.get(ip)
+        if state is None or state.srtt is None:
+            return ceiling
+        return min(ceiling, max(MIN_TIMEOUT, state.srtt + 4 * state.rttvar))
+
+    def network_timeout(self, ceiling):
+        """
+        Timeout for probes to unknown hosts on the network: twice the slowest
+        known host's timeout, at most ceiling.
+        """
+        with self.lock:
+            timeouts = [self.timeout_for(ip, ceiling) for ip, s in self.hosts.items() if s.srtt is not None]
+        if not timeouts:
+            return ceiling
+        return min(ceiling, 2 * max(timeouts))
+
+    def limiter_for(self, ip):
+        """
+        Returns the per-host RateLimiter, or None if the host is not throttled.
+        """
+        state = self.hosts.get(ip)
+        return state.limiter if state is not None else None
+
+    def on_loss(self, ip, global_rate):
+        """
+        Replies from ip were dropped: halve its send rate.
+        """
+        with self.lock:
+            state = self._state(ip)
+            current = state.rate or global_rate or DEFAULT_RATE
+            state.rate = max(MIN_HOST_RATE, current / 2)
+            if state.limiter is None:
+                state.limiter = RateLimiter(state.rate)
+            else:
+                state.limiter.set_rate(state.rate)
+
+    def on_clean(self, ip, global_rate):
+        """
+        A round to ip finished without loss: raise its send rate again and
+        drop the cap once it reaches the global budget.
+        """
+        with self.lock:
+            state = self.hosts.get(ip)
+            if state is None or state.rate is None:
+                return
+            state.rate *= 1.5
+            if state.rate >= (global_rate or DEFAULT_RATE):
+                state.rate = None
+                state.limiter = None
+            else:
+                state.limiter.set_rate(state.rate)
+
+
+# Shared by every scanner in the process.
+host_conditions = HostConditions()
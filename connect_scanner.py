@@ -0,0 +1,298 @@
+# connect_scanner.py
+import errno
+import heapq
+import ipaddress
+import itertools
+import resource
+import selectors
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from congestion import RateLimiter, host_conditions
+from metrics import CONNECT_PROBES
+
+# Connection attempts open at once across every scan.
+MAX_IN_FLIGHT = 1024
+# Longest the event loop sleeps, so cancellations and new scans are noticed.
+POLL_INTERVAL = 0.05
+
+# connect() errors that mean we ran out of local resources, not that the port answered.
+_RESOURCE_ERRORS = {errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.EAGAIN, errno.EADDRNOTAVAIL}
+# Close with RST instead of a FIN handshake so sockets skip TIME_WAIT.
+_LINGER_RESET = struct.pack('ii', 1, 0)
+
+
+def _outcome(sock, err):
+    if err == errno.ECONNREFUSED:
+        return 'closed'
+    if err:
+        return 'error'
+    try:
+        # A connect to a local port that equals the kernel's chosen source
+        # port joins itself (TCP simultaneous open); nothing is listening.
+        if sock.getsockname() == sock.getpeername():
+            return 'closed'
+    except OSError:
+        return 'error'
+    return 'open'
+
+
+def raise_fd_limit(wanted):
+    """
+    Raises the soft open-file limit towards wanted (never past the hard
+    limit). Returns the resulting soft limit.
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        target = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError):
+            pass
+    return soft
+
+
+class _ConnectScan:
+    """
+    Bookkeeping for one call to ConnectScanEngine.scan().
+    """
+    def __init__(self, targets, timeout, retries, cancel, on_open):
+        self.queue = deque((ip, port) for ip, ports in targets.items() for port in ports)
+        self.open_ports = {ip: set() for ip in targets}
+        self.attempts = {}  # (ip, port) -> attempts, for probes that timed out
+        self.timeout = timeout
+        self.retries = retries
+        self.cancel = cancel
+        self.on_open = on_open  # callable(ip, port) run by the event loop on each open port
+        self.in_flight = 0
+        self.error = None  # set if the event loop failed while this scan ran
+        self.done = threading.Event()
+        if not self.queue:
+            self.done.set()
+
+
+class ConnectScanEngine:
+    """
+    TCP connect scanner that needs no privileges. One event loop thread
+    keeps up to max_in_flight non-blocking connect() attempts open with
+    selectors (epoll on Linux), shared round-robin by every running scan.
+    A completed handshake means open, a refusal means closed and silence
+    until the timeout is retried up to retries times. Probe starts draw from
+    rate_limiter, and handshake times feed the per-host RTT estimates.
+    """
+    def __init__(self, rate=10000, max_in_flight=MAX_IN_FLIGHT, retries=1, rate_limiter=None, conditions=None):
+        self.rate_limiter = rate_limiter or RateLimiter(rate)
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.conditions = conditions or host_conditions
+        self.lock = threading.Lock()
+        self.scans = deque()  # scans with probes left to start
+        self.probes = {}  # socket -> (scan, ip, port, started)
+        self.deadlines = []  # heap of (deadline, seq, socket)
+        self.counter = itertools.count()
+        self.selector = None
+        self.waker = None
+        self.thread = None
+
+    def set_rate(self, rate):
+        self.rate_limiter.set_rate(rate)
+
+    def set_max_in_flight(self, max_in_flight):
+        self.max_in_flight = max(1, int(max_in_flight))
+        if self.thread is not None:
+            raise_fd_limit(self.max_in_flight + 256)
+
+    def _ensure_running(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                raise_fd_limit(self.max_in_flight + 256)
+                self.selector = selectors.DefaultSelector()
+                wake_recv, self.waker = socket.socketpair()
+                wake_recv.setblocking(False)
+                self.selector.register(wake_recv, selectors.EVENT_READ, None)
+                self.thread = threading.Thread(target=self._loop, name="connect-scan", daemon=True)
+                self.thread.start()
+
+    def _wake(self):
+        try:
+            self.waker.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass  # the loop is already due to wake up
+
+    def scan(self, targets, timeout=1, retries=None, cancel=None, on_open=None):
+        """
+        Scans targets, a mapping of ip -> iterable of ports. timeout is the
+        longest a connection attempt waits; hosts with a measured RTT get a
+        shorter wait. Setting the cancel Event stops new attempts and returns
+        the ports found so far. on_open(ip, port) is called from the event
+        loop thread as each open port is found and must not block.
+        Returns a mapping of ip -> sorted list of open ports. Raises
+        ValueError unless every target is an IPv4 address.
+        """
+        for ip in targets:
+            if not isinstance(ipaddress.ip_address(ip), ipaddress.IPv4Address):
+                raise ValueError(f"connect scans need IPv4 addresses, not {ip!r}")
+        targets = {ip: list(ports) for ip, ports in targets.items()}
+        scan = _ConnectScan(targets, timeout, self.retries if retries is None else retries, cancel, on_open)
+        if not scan.done.is_set():
+            self._ensure_running()
+            with self.lock:
+                self.scans.append(scan)
+            self._wake()
+            scan.done.wait()
+            if scan.error is not None:
+                raise RuntimeError(f"connect scan failed: {scan.error}")
+        return {ip: sorted(ports) for ip, ports in scan.open_ports.items()}
+
+    def _loop(self):
+        while True:
+            try:
+                self._step()
+            except Exception as e:
+                # Fail the running scans rather than leave them waiting forever.
+                print(f"[-] Connect scan loop error: {e}")
+                self._fail_all(e)
+
+    def _step(self):
+        delay = self._launch()
+        timeout = POLL_INTERVAL if delay is None else min(POLL_INTERVAL, delay)
+        if self.deadlines:
+            timeout = min(timeout, max(0, self.deadlines[0][0] - time.monotonic()))
+        for key, _ in self.selector.select(timeout):
+            if key.data is None:
+                try:
+                    key.fileobj.recv(4096)
+                except BlockingIOError:
+                    pass
+                continue
+            sock = key.fileobj
+            self._finish(sock, _outcome(sock, sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)))
+        self._expire()
+
+    def _fail_all(self, error):
+        # Closes every probe and ends every scan with error.
+        scans = {scan for scan, _, _, _ in self.probes.values()}
+        for sock in list(self.probes):
+            try:
+                self.selector.unregister(sock)
+            except (KeyError, ValueError):
+                pass
+            sock.close()
+        self.probes.clear()
+        self.deadlines.clear()
+        with self.lock:
+            scans.update(self.scans)
+            self.scans.clear()
+            for scan in scans:
+                scan.error = error
+                scan.queue.clear()
+                scan.in_flight = 0
+                scan.done.set()
+
+    def _next_probe(self):
+        # Called with self.lock held. Takes the next probe, round-robin over scans.
+        while self.scans:
+            scan = self.scans.popleft()
+            if scan.cancel is not None and scan.cancel.is_set():
+                scan.queue.clear()
+            if not scan.queue:
+                self._maybe_done(scan)
+                continue
+            probe = scan.queue.popleft()
+            self.scans.append(scan)
+            return scan, probe
+        return None
+
+    def _launch(self):
+        # Starts probes until the in-flight or rate limit is hit. Returns the
+        # seconds until the rate limit allows the next one, or None.
+        while len(self.probes) < self.max_in_flight:
+            with self.lock:
+                if not self.scans:
+                    return None
+            delay = self.rate_limiter.take()
+            if delay:
+                return delay
+            with self.lock:
+                taken = self._next_probe()
+            if taken is None:
+                return None
+            scan, (ip, port) = taken
+            try:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            except OSError as e:
+                if e.errno not in _RESOURCE_ERRORS:
+                    raise
+                # Out of file descriptors: retry once others have finished.
+                with self.lock:
+                    scan.queue.appendleft((ip, port))
+                return POLL_INTERVAL
+            sock.setblocking(False)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, _LINGER_RESET)
+            try:
+                err = sock.connect_ex((ip, port))
+            except OSError as e:
+                # e.g. an address the kernel cannot route to
+                err = e.errno or errno.EINVAL
+            if err in _RESOURCE_ERRORS:
+                # Out of sockets or ports: retry the probe once others have finished.
+                sock.close()
+                with self.lock:
+                    scan.queue.appendleft((ip, port))
+                return POLL_INTERVAL
+            scan.in_flight += 1
+            self.probes[sock] = (scan, ip, port, time.monotonic())
+            if err == errno.EINPROGRESS:
+                self.selector.register(sock, selectors.EVENT_WRITE, True)
+                deadline = time.monotonic() + self.conditions.timeout_for(ip, scan.timeout)
+                heapq.heappush(self.deadlines, (deadline, next(self.counter), sock))
+            else:
+                self._finish(sock, _outcome(sock, err), registered=False)
+        return None
+
+    def _finish(self, sock, result, registered=True):
+        scan, ip, port, started = self.probes.pop(sock)
+        if registered:
+            self.selector.unregister(sock)
+        sock.close()
+        scan.in_flight -= 1
+        CONNECT_PROBES.labels(result).inc()
+        if result == 'timeout':
+            attempts = scan.attempts.get((ip, port), 1)
+            cancelled = scan.cancel is not None and scan.cancel.is_set()
+            if attempts <= scan.retries and not cancelled:
+                scan.attempts[(ip, port)] = attempts + 1
+                with self.lock:
+                    scan.queue.append((ip, port))
+                    if scan not in self.scans:
+                        self.scans.append(scan)
+        else:
+            if result != 'error' and (ip, port) not in scan.attempts:
+                # Karn's rule: only first attempts give a usable RTT.
+                self.conditions.record_rtt(ip, time.monotonic() - started)
+            if result == 'open':
+                scan.open_ports[ip].add(port)
+                if scan.on_open is not None:
+                    try:
+                        scan.on_open(ip, port)
+                    except Exception as e:
+                        print(f"[-] Open port callback failed for {ip}:{port}: {e}")
+        with self.lock:
+            self._maybe_done(scan)
+
+    def _maybe_done(self, scan):
+        # Called with self.lock held.
+        if not scan.queue and not scan.in_flight and not scan.done.is_set():
+            if scan in self.scans:
+                self.scans.remove(scan)
+            scan.done.set()
+
+    def _expire(self):
+        now = time.monotonic()
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, _, sock = heapq.heappop(self.deadlines)
+            if sock in self.probes:
+                self._finish(sock, 'timeout')
@@ -1,14 +1,343 @@
 # db.py
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from models import Base
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import create_engine, event, case, update, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import sessionmaker, scoped_session
+from models import Base, Host, Port, ScanObservation, Banner, VendorCache
+from helper import filter_numeric_ports
+from metrics import DB_COMMIT_SECONDS
 
 # Create an engine; this will create (or use) the spynet.db SQLite file.
-engine = create_engine('sqlite:///spynet.db', echo=False)
+# SPYNET_DB_URL may name another SQLite file or a PostgreSQL database; the
+# upserts below need INSERT ... ON CONFLICT, which other databases lack.
+DATABASE_URL = os.environ.get('SPYNET_DB_URL', 'sqlite:///spynet.db')
+engine = create_engine(DATABASE_URL, echo=False)
+if engine.dialect.name == 'postgresql':
+    insert = postgresql.insert
+elif engine.dialect.name == 'sqlite':
+    insert = sqlite.insert
+else:
+    raise RuntimeError(f"SPYNET_DB_URL: unsupported database '{engine.dialect.name}' (use SQLite or PostgreSQL)")
+
+# SQLite limits the number of bound parameters per statement.
+BATCH_SIZE = 500
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the scanner's writes, and synchronous=NORMAL
+    # only fsyncs at checkpoints instead of on every commit.
+    if engine.dialect.name != 'sqlite':
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
 
 # Create all tables (if they don't exist)
 Base.metadata.create_all(engine)
 
-# Create a session factory and a session instance.
+# Session factory, plus a thread-local session registry: every thread (Flask
+# request, scan loop, background worker) gets its own session from db_session.
 Session = sessionmaker(bind=engine)
-db_session = Session()
+db_session = scoped_session(Session)
+
+@contextmanager
+def session_scope():
+    """
+    Provides a short-lived session that commits on success, rolls back on
+    error and is always closed.
+    """
+    session = Session()
+    try:
+        yield session
+        with DB_COMMIT_SECONDS.time():
+            session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def _batches(items):
+    for i in range(0, len(items), BATCH_SIZE):
+        yield items[i:i + BATCH_SIZE]
+
+def upsert_arp_results(live_hosts, seen_at):
+    """
+    Inserts or updates every host found by an ARP scan in one transaction.
+    Only the ARP fields are touched; hostname and is_dhcp are manual fields.
+    A known vendor is never replaced with "Unknown".
+    Returns a mapping of ip -> (hostname, is_dhcp) for the given hosts.
+    """
+    if not live_hosts:
+        return {}
+    rows = [{'ip': h['ip'], 'mac': h['mac'], 'vendor': h['vendor'], 'last_seen': seen_at,
+             'hostname': "", 'is_dhcp': False} for h in live_hosts]
+    stmt = insert(Host)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Host.ip],
+        set_={
+            'mac': stmt.excluded.mac,
+            'last_seen': stmt.excluded.last_seen,
+            'vendor': case((stmt.excluded.vendor != "Unknown", stmt.excluded.vendor),
+                           (Host.vendor == "Unknown", stmt.excluded.vendor),
+                           else_=Host.vendor),
+        })
+    manual = {}
+    with session_scope() as session:
+        for batch in _batches(rows):
+            session.execute(stmt, batch)
+        ips = [row['ip'] for row in rows]
+        for batch in _batches(ips):
+            for ip, hostname, is_dhcp in session.query(Host.ip, Host.hostname, Host.is_dhcp).filter(Host.ip.in_(batch)):
+                manual[ip] = (hostname, is_dhcp)
+    return manual
+
+def save_port_results(results, observed_at=None, protocol="tcp"):
+    """
+    Stores the outcome of port scans for many hosts in one transaction.
+    results maps ip -> (scanned_ports, open_ports). Open ports are upserted
+    into the ports table; a port that changes state (newly open, reopened,
+    or previously open and now closed) also gets a scan observation.
+    """
+    if not results:
+        return
+    observed_at = observed_at or datetime.utcnow()
+    ips = list(results)
+    with session_scope() as session:
+        known = {}  # ip -> {port: state}
+        for batch in _batches(ips):
+            rows = session.query(Port.ip, Port.port, Port.state).filter(Port.ip.in_(batch), Port.protocol == protocol)
+            for ip, port, state in rows:
+                known.setdefault(ip, {})[port] = state
+        upserts, closed, observations = [], [], []
+        for ip, (scanned_ports, open_ports) in results.items():
+            open_ports = set(open_ports)
+            host_known = known.get(ip, {})
+            for port in open_ports:
+                upserts.append({'ip': ip, 'port': port, 'protocol': protocol, 'state': "open",
+                                'first_seen': observed_at, 'last_seen': observed_at})
+                if host_known.get(port) != "open":
+                    observations.append({'ip': ip, 'port': port, 'protocol': protocol,
+                                         'state': "open", 'observed_at': observed_at})
+            scanned = set(scanned_ports)
+            for port, state in host_known.items():
+                if state == "open" and port in scanned and port not in open_ports:
+                    closed.append({'b_ip': ip, 'b_port': port})
+                    observations.append({'ip': ip, 'port': port, 'protocol': protocol,
+                                         'state': "closed", 'observed_at': observed_at})
+        stmt = insert(Port)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Port.ip, Port.port, Port.protocol],
+            set_={'state': stmt.excluded.state, 'last_seen': stmt.excluded.last_seen})
+        for batch in _batches(upserts):
+            session.execute(stmt, batch)
+        close_stmt = (update(Port)
+                      .where(Port.ip == bindparam('b_ip'), Port.port == bindparam('b_port'), Port.protocol == protocol)
+                      .values(state="closed"))
+        for batch in _batches(closed):
+            session.connection().execute(close_stmt, batch)
+        for batch in _batches(observations):
+            session.execute(insert(ScanObservation), batch)
+
+def load_open_ports(session, ips=None, state="open"):
+    """
+    Returns a mapping of ip -> sorted list of ports in the given state
+    (None for every recorded port), optionally limited to the given ips.
+    """
+    query = session.query(Port.ip, Port.port)
+    if state is not None:
+        query = query.filter(Port.state == state)
+    batches = _batches(list(ips)) if ips is not None else [None]
+    ports = {}
+    for batch in batches:
+        batch_query = query if batch is None else query.filter(Port.ip.in_(batch))
+        for ip, port in batch_query.order_by(Port.ip, Port.port):
+            ports.setdefault(ip, []).append(port)
+    return ports
+
+def migrate_legacy_ports():
+    """
+    Moves ports stored in the old comma-separated hosts.port_scan_result
+    column into the ports table. Runs once per host; the old value is cleared.
+    """
+    with session_scope() as session:
+        legacy = session.query(Host).filter(Host.port_scan_result != "", Host.port_scan_result.isnot(None)).all()
+        for host in legacy:
+            for port in filter_numeric_ports(host.port_scan_result.split(',')):
+                session.merge(Port(ip=host.ip, port=port, protocol="tcp", state="open",
+                                   first_seen=host.last_seen, last_seen=host.last_seen))
+            host.port_scan_result = ""
+
+def _page(query, page, per_page):
+    # Fetch one extra row to know whether another page exists.
+    rows = query.offset((page - 1) * per_page).limit(per_page + 1).all()
+    return rows[:per_page], len(rows) > per_page
+
+def query_ports(port=None, ip=None, state="open", protocol="tcp", page=1, per_page=100):
+    """
+    Paginated lookup of the ports table, e.g. every host with 3389 open.
+    Returns (rows, has_more).
+    """
+    with session_scope() as session:
+        query = session.query(Port).filter(Port.protocol == protocol)
+        if port is not None:
+            query = query.filter(Port.port == port)
+        if ip is not None:
+            query = query.filter(Port.ip == ip)
+        if state is not None:
+            query = query.filter(Port.state == state)
+        rows, has_more = _page(query.order_by(Port.port, Port.ip), page, per_page)
+        return [{'ip': r.ip, 'port': r.port, 'protocol': r.protocol, 'state': r.state,
+                 'first_seen': r.first_seen.isoformat() + 'Z', 'last_seen': r.last_seen.isoformat() + 'Z'}
+                for r in rows], has_more
+
+def query_changes(since, port=None, ip=None, page=1, per_page=100):
+    """
+    Paginated scan observations recorded after since (a naive UTC datetime),
+    oldest first. Returns (rows, has_more).
+    """
+    with session_scope() as session:
+        query = session.query(ScanObservation).filter(ScanObservation.observed_at > since)
+        if port is not None:
+            query = query.filter(ScanObservation.port == port)
+        if ip is not None:
+            query = query.filter(ScanObservation.ip == ip)
+        rows, has_more = _page(query.order_by(ScanObservation.observed_at, ScanObservation.id), page, per_page)
+        return [{'ip': r.ip, 'port': r.port, 'protocol': r.protocol, 'state': r.state,
+                 'observed_at': r.observed_at.isoformat() + 'Z'}
+                for r in rows], has_more
+
+def _open_port_ips(session, port, protocol):
+    return session.query(Port.ip).filter(Port.port == port, Port.protocol == protocol, Port.state == "open")
+
+def iter_hosts(vendor=None, port=None, protocol="tcp"):
+    """
+    Yields (host row, open ports) for every stored host in ip order, reading
+    BATCH_SIZE rows at a time so memory use does not grow with the table.
+    vendor matches as a case-insensitive substring; port keeps only hosts
+    with that port open.
+    """
+    with session_scope() as session:
+        hosts = session.query(Host.ip, Host.mac, Host.vendor, Host.hostname, Host.is_dhcp, Host.last_seen)
+        ports = session.query(Port.ip, Port.port).filter(Port.protocol == protocol, Port.state == "open")
+        if vendor:
+            hosts = hosts.filter(Host.vendor.ilike(f"%{vendor}%"))
+        if port is not None:
+            hosts = hosts.filter(Host.ip.in_(_open_port_ips(session, port, protocol)))
+        # Both streams are in ip order, so ports are matched to hosts in one pass.
+        port_rows = iter(ports.order_by(Port.ip, Port.port).yield_per(BATCH_SIZE))
+        pending = next(port_rows, None)
+        for host in hosts.order_by(Host.ip).yield_per(BATCH_SIZE):
+            while pending is not None and pending.ip < host.ip:
+                pending = next(port_rows, None)
+            open_ports = []
+            while pending is not None and pending.ip == host.ip:
+                open_ports.append(pending.port)
+                pending = next(port_rows, None)
+            yield host, open_ports
+
+def iter_ports(port=None, state="open", vendor=None, protocol="tcp"):
+    """
+    Yields rows of the ports table, with the host's vendor, in ip and port
+    order, BATCH_SIZE rows at a time. state=None includes every state.
+    """
+    with session_scope() as session:
+        query = session.query(Port.ip, Port.port, Port.protocol, Port.state, Port.first_seen, Port.last_seen,
+                              Host.vendor).outerjoin(Host, Host.ip == Port.ip).filter(Port.protocol == protocol)
+        if port is not None:
+            query = query.filter(Port.port == port)
+        if state is not None:
+            query = query.filter(Port.state == state)
+        if vendor:
+            query = query.filter(Host.vendor.ilike(f"%{vendor}%"))
+        for row in query.order_by(Port.ip, Port.port).yield_per(BATCH_SIZE):
+            yield row
+
+def save_vendor(ips, vendor):
+    """
+    Sets the vendor on every listed host in one transaction.
+    """
+    if not ips:
+        return
+    with session_scope() as session:
+        for batch in _batches(list(ips)):
+            session.query(Host).filter(Host.ip.in_(batch)).update({Host.vendor: vendor}, synchronize_session=False)
+
+def save_vendors(rows):
+    """
+    Inserts or replaces resolved MAC vendors, given as dicts with the
+    VendorCache columns, in one transaction.
+    """
+    if not rows:
+        return
+    stmt = insert(VendorCache)
+    stmt = stmt.on_conflict_do_update(index_elements=[VendorCache.mac],
+                                      set_={c: getattr(stmt.excluded, c) for c in ('vendor', 'source', 'updated')})
+    with session_scope() as session:
+        for batch in _batches(rows):
+            session.execute(stmt, batch)
+
+def save_host_fields(ip, **fields):
+    """
+    Sets the given columns on one host, e.g. is_dhcp learned from a DHCP lease.
+    """
+    with session_scope() as session:
+        session.query(Host).filter(Host.ip == ip).update(fields, synchronize_session=False)
+
+def save_banners(rows):
+    """
+    Inserts or replaces grabbed banners, given as dicts with the Banner
+    columns, in one transaction.
+    """
+    if not rows:
+        return
+    stmt = insert(Banner)
+    columns = ('service', 'banner', 'tls', 'cert_subject', 'cert_issuer', 'cert_not_after', 'cert_san',
+               'error', 'grabbed_at')
+    stmt = stmt.on_conflict_do_update(index_elements=[Banner.ip, Banner.port, Banner.protocol],
+                                      set_={c: getattr(stmt.excluded, c) for c in columns})
+    with session_scope() as session:
+        for batch in _batches(rows):
+            session.execute(stmt, batch)
+
+def _banner_dict(row):
+    return {'ip': row.ip, 'port': row.port, 'protocol': row.protocol, 'service': row.service,
+            'banner': row.banner, 'tls': row.tls, 'cert_subject': row.cert_subject,
+            'cert_issuer': row.cert_issuer,
+            'cert_not_after': row.cert_not_after.isoformat() + 'Z' if row.cert_not_after else None,
+            'cert_san': row.cert_san.split(',') if row.cert_san else [],
+            'error': row.error, 'grabbed_at': row.grabbed_at.isoformat() + 'Z'}
+
+def load_banner(ip, port, since=None, protocol="tcp"):
+    """
+    Returns the stored banner for ip:port as a dict, or None if there is
+    none grabbed at or after since.
+    """
+    with session_scope() as session:
+        query = session.query(Banner).filter(Banner.ip == ip, Banner.port == port, Banner.protocol == protocol)
+        if since is not None:
+            query = query.filter(Banner.grabbed_at >= since)
+        row = query.one_or_none()
+        return _banner_dict(row) if row is not None else None
+
+def fresh_banners(targets, since, protocol="tcp"):
+    """
+    Returns the set of (ip, port) among targets (ip -> ports) that have a
+    banner grabbed at or after since.
+    """
+    fresh = set()
+    if not targets:
+        return fresh
+    with session_scope() as session:
+        for batch in _batches(list(targets)):
+            rows = session.query(Banner.ip, Banner.port).filter(
+                Banner.ip.in_(batch), Banner.protocol == protocol, Banner.grabbed_at >= since)
+            fresh.update((ip, port) for ip, port in rows if port in targets[ip])
+    return fresh
+
+migrate_legacy_ports()
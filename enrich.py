@@ -0,0 +1,236 @@
+# enrich.py
+import asyncio
+import concurrent.futures
+import ipaddress
+import socket
+import ssl
+import threading
+import time
+from datetime import datetime, timedelta
+from db import save_banners, load_banner, fresh_banners, BATCH_SIZE
+from metrics import BANNER_GRAB_SECONDS
+
+# Stored banners are reused for this many seconds before being grabbed again.
+BANNER_TTL = 24 * 3600
+# Banner grabs in flight at once in the background.
+ENRICH_CONCURRENCY = 32
+# Grabs for API requests have their own slots so they never queue behind
+# the background backlog.
+INTERACTIVE_CONCURRENCY = 8
+BANNER_TIMEOUT = 3
+BANNER_BYTES = 1024
+
+# Ports that speak TLS from the first byte.
+SSL_PORTS = {443, 465, 993, 995, 990, 636, 8443}
+# Sent when a service stays silent after connecting.
+BANNER_PROBES = {
+    80: "GET / HTTP/1.1\r\nHost: {host}\r\n\r\n",
+    443: "GET / HTTP/1.1\r\nHost: {host}\r\n\r\n",
+    8443: "GET / HTTP/1.1\r\nHost: {host}\r\n\r\n",
+    21: "\r\n",                 # FTP
+    25: "EHLO example.com\r\n", # SMTP
+    465: "EHLO example.com\r\n",# SMTP over SSL
+    110: "\r\n",                # POP3
+    995: "\r\n",                # POP3S
+    143: "\r\n",                # IMAP
+    993: "\r\n",                # IMAPS
+    636: "\r\n",                # LDAPS
+    990: "\r\n",                # Implicit FTPS
+}
+
+SAN_OID = '2.5.29.17'
+
+
+def identify_service(port, banner, tls=False):
+    """
+    Guesses the service from its banner, falling back to the port's
+    registered name.
+    """
+    first = banner.split('\n', 1)[0].upper()
+    if first.startswith('SSH-'):
+        return 'ssh'
+    if first.startswith('HTTP/'):
+        return 'https' if tls else 'http'
+    if first.startswith('220') and 'FTP' in first:
+        return 'ftp'
+    if first.startswith('220') and 'SMTP' in first:
+        return 'smtp'
+    if first.startswith('+OK'):
+        return 'pop3'
+    if first.startswith('* OK'):
+        return 'imap'
+    if first.startswith('RFB '):
+        return 'vnc'
+    try:
+        return socket.getservbyport(port, 'tcp')
+    except OSError:
+        return ""
+
+
+def certificate_details(der):
+    """
+    Returns subject, issuer, expiry and subjectAltName entries of a DER
+    encoded certificate as Banner columns.
+    """
+    # Parsed with scapy's ASN.1 layer, imported on first use as it is slow to load.
+    from scapy.layers.x509 import X509_Cert
+    cert = X509_Cert(der).tbsCertificate
+    names = []
+    for ext in cert.extensions or []:
+        if ext.extnID.val != SAN_OID:
+            continue
+        for entry in ext.extnValue.subjectAltName:
+            name = entry.generalName
+            if 'dNSName' in name.fields:
+                names.append(name.dNSName.val.decode('ascii', errors='replace'))
+            elif 'iPAddress' in name.fields:
+                names.append(str(ipaddress.ip_address(name.iPAddress.val)))
+    not_after = cert.validity.not_after.datetime
+    return {
+        'cert_subject': cert.get_subject_str(),
+        'cert_issuer': cert.get_issuer_str(),
+        'cert_not_after': not_after.replace(tzinfo=None) if not_after else None,
+        'cert_san': ','.join(names) or None,
+    }
+
+
+def _tls_context():
+    # Certificates are recorded, not trusted: self-signed ones are the norm on a LAN.
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+async def _read(reader, timeout):
+    try:
+        return await asyncio.wait_for(reader.read(BANNER_BYTES), timeout)
+    except asyncio.TimeoutError:
+        return b""
+
+
+class BannerEnricher:
+    """
+    Grabs banners and TLS certificates on its own asyncio loop thread, at
+    most concurrency at a time in the background plus interactive ones for
+    API requests, sharing one TLS context. Results are stored per
+    (ip, port) and reused for ttl seconds.
+    """
+    def __init__(self, concurrency=ENRICH_CONCURRENCY, ttl=BANNER_TTL, timeout=BANNER_TIMEOUT,
+                 interactive=INTERACTIVE_CONCURRENCY):
+        self.concurrency = concurrency
+        self.interactive = interactive
+        self.ttl = ttl
+        self.timeout = timeout
+        self.tls_context = _tls_context()
+        self.loop = None
+        self.semaphore = None  # background grabs
+        self.interactive_semaphore = None  # grab_now
+        self.lock = threading.Lock()
+        self.pending = set()  # (ip, port) queued for background enrichment
+
+    def _ensure_running(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.semaphore = asyncio.Semaphore(self.concurrency)
+                self.interactive_semaphore = asyncio.Semaphore(self.interactive)
+                threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return self.loop
+
+    def cached(self, ip, port):
+        """
+        Returns the stored banner for ip:port if it is younger than the TTL.
+        Failed grabs are not served from the cache.
+        """
+        row = load_banner(ip, port, since=datetime.utcnow() - timedelta(seconds=self.ttl))
+        return row if row is not None and not row['error'] else None
+
+    def submit(self, targets):
+        """
+        Queues background grabs for targets (ip -> ports), skipping ports
+        with a fresh banner or a grab already queued.
+        """
+        with self.lock:
+            targets = {ip: [p for p in ports if (ip, p) not in self.pending] for ip, ports in targets.items()}
+            targets = {ip: ports for ip, ports in targets.items() if ports}
+            self.pending.update((ip, p) for ip, ports in targets.items() for p in ports)
+        if targets:
+            asyncio.run_coroutine_threadsafe(self._enrich(targets), self._ensure_running())
+
+    def grab_now(self, ip, port, timeout=None):
+        """
+        Grabs and stores one banner, blocking until it is done. Returns it
+        as a dict like the cached ones. Raises TimeoutError if no
+        interactive slot frees up in time.
+        """
+        timeout = timeout or self.timeout
+        loop = self._ensure_running()
+        future = asyncio.run_coroutine_threadsafe(self._grab(ip, port, timeout, self.interactive_semaphore), loop)
+        try:
+            # Connecting and up to two reads, plus a turn waiting for a slot.
+            row = future.result(timeout * 4)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"banner grab of {ip}:{port} timed out")
+        save_banners([row])
+        return load_banner(ip, port)
+
+    async def _enrich(self, targets):
+        loop = asyncio.get_running_loop()
+        try:
+            since = datetime.utcnow() - timedelta(seconds=self.ttl)
+            fresh = await loop.run_in_executor(None, fresh_banners, targets, since)
+            grabs = [self._grab(ip, port, self.timeout, self.semaphore)
+                     for ip, ports in targets.items() for port in ports if (ip, port) not in fresh]
+            rows = []
+            for grab in asyncio.as_completed(grabs):
+                rows.append(await grab)
+                if len(rows) >= BATCH_SIZE:
+                    await loop.run_in_executor(None, save_banners, rows)
+                    rows = []
+            await loop.run_in_executor(None, save_banners, rows)
+            if grabs:
+                print(f"[+] Grabbed {len(grabs)} banners")
+        except Exception as e:
+            print(f"[-] Banner enrichment failed: {e}")
+        finally:
+            with self.lock:
+                self.pending.difference_update((ip, p) for ip, ports in targets.items() for p in ports)
+
+    async def _grab(self, ip, port, timeout, semaphore):
+        # Returns a Banner row as a dict; failures are recorded in 'error'.
+        tls = port in SSL_PORTS
+        row = {'ip': ip, 'port': port, 'protocol': "tcp", 'service': "", 'banner': "", 'tls': tls,
+               'cert_subject': None, 'cert_issuer': None, 'cert_not_after': None, 'cert_san': None,
+               'error': None, 'grabbed_at': datetime.utcnow()}
+        start = time.perf_counter()
+        async with semaphore:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(ip, port, ssl=self.tls_context if tls else None), timeout)
+                try:
+                    if tls:
+                        der = writer.get_extra_info('ssl_object').getpeercert(binary_form=True)
+                        if der:
+                            try:
+                                row.update(certificate_details(der))
+                            except Exception as e:
+                                print(f"[-] Could not parse the certificate of {ip}:{port}: {e}")
+                    data = await _read(reader, timeout)
+                    if not data and port in BANNER_PROBES:
+                        writer.write(BANNER_PROBES[port].format(host=ip).encode('utf-8'))
+                        await writer.drain()
+                        data = await _read(reader, timeout)
+                finally:
+                    writer.close()
+                row['banner'] = data.decode('utf-8', errors='ignore').strip()
+            except (OSError, asyncio.TimeoutError) as e:
+                row['error'] = str(e) or type(e).__name__
+        row['service'] = identify_service(port, row['banner'], tls)
+        BANNER_GRAB_SECONDS.labels('error' if row['error'] else 'ok').observe(time.perf_counter() - start)
+        return row
+
+
+# Shared by the scan loop and the API.
+enricher = BannerEnricher()
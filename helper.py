@@ -13,3 +13,25 @@ def filter_numeric_ports(port_list):
             filtered.add(int(port))
         # Otherwise, ignore it.
     return filtered
+
+def ports_to_ranges(ports):
+    """
+    Compresses a list of ports into sorted [start, end] ranges,
+    e.g. [1, 2, 3, 80] -> [[1, 3], [80, 80]].
+    """
+    ranges = []
+    for port in sorted(set(ports)):
+        if ranges and port == ranges[-1][1] + 1:
+            ranges[-1][1] = port
+        else:
+            ranges.append([port, port])
+    return ranges
+
+def ranges_to_ports(ranges):
+    """
+    Expands [start, end] ranges produced by ports_to_ranges back into a list of ports.
+    """
+    ports = []
+    for start, end in ranges:
+        ports.extend(range(int(start), int(end) + 1))
+    return ports
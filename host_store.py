@@ -0,0 +1,93 @@
+# host_store.py
+from types import MappingProxyType
+
+
+def ports_to_bitmap(ports):
+    """
+    Packs port numbers (1-65535) into one int with bit N set for port N.
+    """
+    bitmap = 0
+    for port in ports:
+        bitmap |= 1 << port
+    return bitmap
+
+
+def bitmap_to_ports(bitmap):
+    """
+    Returns the sorted list of ports set in bitmap.
+    """
+    ports = []
+    while bitmap:
+        low = bitmap & -bitmap
+        ports.append(low.bit_length() - 1)
+        bitmap ^= low
+    return ports
+
+
+class HostRecord:
+    """
+    One host in the in-memory store. Records are never modified once stored:
+    writers build a new one with replace(), so a snapshot can hand out the
+    same objects to readers without copying or locking them.
+    """
+    __slots__ = ('mac', 'vendor', 'port_bits', 'status', 'last_seen',
+                 'port_scan_in_progress', 'hostname', 'is_dhcp')
+
+    def __init__(self, mac='', vendor='', port_bits=0, status='unknown', last_seen=0.0,
+                 port_scan_in_progress=False, hostname='', is_dhcp=False):
+        self.mac = mac
+        self.vendor = vendor
+        self.port_bits = port_bits
+        self.status = status
+        self.last_seen = last_seen
+        self.port_scan_in_progress = port_scan_in_progress
+        self.hostname = hostname
+        self.is_dhcp = is_dhcp
+
+    @property
+    def ports(self):
+        return bitmap_to_ports(self.port_bits)
+
+    def replace(self, **fields):
+        """
+        Returns a copy with the given fields changed. A 'ports' iterable is
+        accepted in place of port_bits.
+        """
+        if 'ports' in fields:
+            fields['port_bits'] = ports_to_bitmap(fields.pop('ports'))
+        record = HostRecord.__new__(HostRecord)
+        for name in self.__slots__:
+            setattr(record, name, fields.pop(name, getattr(self, name)))
+        if fields:
+            raise TypeError(f"Unknown host fields: {', '.join(fields)}")
+        return record
+
+    def to_dict(self):
+        """
+        The host as served by the API and sent to the dashboard.
+        """
+        return {
+            'mac': self.mac,
+            'vendor': self.vendor,
+            'ports': bitmap_to_ports(self.port_bits),
+            'status': self.status,
+            'last_seen': self.last_seen,
+            'port_scan_in_progress': self.port_scan_in_progress,
+            'hostname': self.hostname,
+            'is_dhcp': self.is_dhcp,
+        }
+
+
+class HostSnapshot:
+    """
+    Read-only view of the host store at one revision. hosts maps
+    ip -> HostRecord and must not be modified.
+    """
+    __slots__ = ('revision', 'hosts')
+
+    def __init__(self, revision, hosts):
+        self.revision = revision
+        self.hosts = MappingProxyType(hosts)
+
+    def to_dicts(self):
+        return {ip: record.to_dict() for ip, record in self.hosts.items()}
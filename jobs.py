@@ -0,0 +1,192 @@
+# jobs.py
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import wait, FIRST_COMPLETED
+from port_scanner import submit_port_scan, CHUNK_SIZE
+from scheduler import PRIORITY_INTERACTIVE
+
+# On-demand scans running at once; later jobs wait in the 'queued' state.
+MAX_RUNNING_JOBS = 4
+# Finished jobs kept for /api/jobs lookups.
+JOB_HISTORY = 200
+# Seconds between progress events while a job runs.
+PROGRESS_INTERVAL = 0.25
+
+
+class PortScanJob:
+    """
+    One on-demand port scan of a single host.
+    state is 'queued', 'running', 'done', 'cancelled' or 'failed'.
+    """
+    def __init__(self, host, ports, timeout, priority, engine=None):
+        self.id = uuid.uuid4().hex
+        self.host = host
+        self.ports = ports
+        self.timeout = timeout
+        self.priority = priority
+        self.engine = engine
+        self.state = 'queued'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.scanned = 0
+        self.open_ports = set()
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.new_ports = []  # open ports found since the last progress event
+
+    def found(self, ip, port):
+        # Runs on the scan engine's receiver thread, so it only records the port.
+        with self.lock:
+            self.new_ports.append(port)
+
+    def take_new_ports(self):
+        with self.lock:
+            ports = sorted(set(self.new_ports) - self.open_ports)
+            self.new_ports = []
+            self.open_ports.update(ports)
+        return ports
+
+    @property
+    def progress(self):
+        return round(100.0 * self.scanned / len(self.ports), 1) if self.ports else 100.0
+
+    def to_dict(self):
+        with self.lock:
+            open_ports = sorted(self.open_ports)
+        return {
+            'job_id': self.id,
+            'host': self.host,
+            'engine': self.engine,
+            'state': self.state,
+            'progress': self.progress,
+            'scanned': self.scanned,
+            'total': len(self.ports),
+            'open_ports': open_ports,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'error': self.error,
+        }
+
+
+class JobManager:
+    """
+    Runs on-demand port scans as tracked, cancellable jobs, at most
+    max_running at a time. Listeners are called with (event, payload):
+    'port_scan_progress' while a job runs (with the open ports found since
+    the previous event in 'new_open_ports') and 'port_scan_result' when it
+    ends.
+    """
+    def __init__(self, max_running=MAX_RUNNING_JOBS, history=JOB_HISTORY):
+        self.slots = threading.BoundedSemaphore(max_running)
+        self.history = history
+        self.jobs = OrderedDict()  # job id -> PortScanJob, oldest first
+        self.lock = threading.Lock()
+        self.listeners = []
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def _notify(self, event, job, **extra):
+        payload = job.to_dict()
+        payload.update(extra)
+        for callback in self.listeners:
+            try:
+                callback(event, payload)
+            except Exception as e:
+                print(f"[-] Job listener failed: {e}")
+
+    def submit(self, host, ports, timeout=1, priority=PRIORITY_INTERACTIVE, on_finish=None, engine=None):
+        """
+        Starts a port scan job with the named scan engine and returns it.
+        on_finish(job) runs once the job has ended, before the final
+        'port_scan_result' event.
+        """
+        job = PortScanJob(host, list(ports), timeout, priority, engine)
+        with self.lock:
+            self.jobs[job.id] = job
+            finished = [j.id for j in self.jobs.values() if j.finished is not None]
+            for job_id in finished[:max(0, len(self.jobs) - self.history)]:
+                del self.jobs[job_id]
+        self._notify('port_scan_progress', job, new_open_ports=[])
+        threading.Thread(target=self._run, args=(job, on_finish), daemon=True).start()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        """
+        Asks a job to stop. Queued chunks are dropped and running ones stop
+        sending probes. Returns the job, or None if it is unknown.
+        """
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.cancel_event.set()
+        return job
+
+    def _run(self, job, on_finish):
+        acquired = False
+        while not job.cancel_event.is_set():
+            if self.slots.acquire(timeout=PROGRESS_INTERVAL):
+                acquired = True
+                break
+        complete = False
+        try:
+            if acquired:
+                complete = self._scan(job)
+        except Exception as e:
+            print(f"[-] Port scan job {job.id} failed: {e}")
+            job.error = str(e)
+        finally:
+            if acquired:
+                self.slots.release()
+        if job.error:
+            job.state = 'failed'
+        else:
+            job.state = 'done' if complete else 'cancelled'
+        job.finished = time.time()
+        if on_finish is not None:
+            try:
+                on_finish(job)
+            except Exception as e:
+                print(f"[-] Port scan job {job.id} callback failed: {e}")
+        self._notify('port_scan_result', job)
+
+    def _scan(self, job):
+        # Returns True if every port was scanned.
+        job.state = 'running'
+        job.started = time.time()
+        self._notify('port_scan_progress', job, new_open_ports=[])
+        futures = submit_port_scan(job.host, job.ports, job.timeout, job.priority,
+                                   cancel=job.cancel_event, on_open=job.found, engine=job.engine)
+        pending = {f: min(CHUNK_SIZE, len(job.ports) - i * CHUNK_SIZE) for i, f in enumerate(futures)}
+        while pending:
+            if job.cancel_event.is_set():
+                for f in pending:
+                    f.cancel()
+            done, _ = wait(list(pending), timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+            for f in done:
+                size = pending.pop(f)
+                if f.cancelled():
+                    continue
+                try:
+                    with job.lock:
+                        job.new_ports.extend(f.result())
+                except Exception as e:
+                    job.error = str(e)
+                    continue
+                if not job.cancel_event.is_set():
+                    job.scanned += size
+            new_ports = job.take_new_ports()
+            if done or new_ports:
+                self._notify('port_scan_progress', job, new_open_ports=new_ports)
+        return job.scanned == len(job.ports) and not job.error
@@ -0,0 +1,206 @@
+# metrics.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Default histogram buckets in seconds.
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.children = {}
+        if not self.labelnames:
+            # Unlabelled series are exported from the start, at zero.
+            self._default()
+        registry.append(self)
+
+    def labels(self, *values):
+        """
+        Returns the child metric for these label values (cached).
+        """
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        # Unlabelled metrics use a single child with no label values.
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self.children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {self.value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class _GaugeChild:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """
+        Computes the value at scrape time instead of on the hot path.
+        """
+        self.function = function
+
+    def render(self, name, labelnames, values):
+        value = self.function() if self.function else self.value
+        return [f"{name}{_format_labels(labelnames, values)} {value}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def render(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float('inf') else repr(bound)
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, [('le', le)])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {self.sum}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {self.count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=TIME_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+def render():
+    """
+    Returns every registered metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Scanner metrics. Children for fixed label values are resolved once here so
+# the hot paths only pay for an increment.
+SYN_PROBES_SENT = Counter('spynet_syn_probes_sent_total', "SYN probes sent, including retransmits")
+SYN_REPLIES = Counter('spynet_syn_replies_total', "Matched SYN probe replies", ['result'])
+SYN_REPLIES_OPEN = SYN_REPLIES.labels('open')
+SYN_REPLIES_CLOSED = SYN_REPLIES.labels('closed')
+CONNECT_PROBES = Counter('spynet_connect_probes_total', "TCP connect scan attempts by outcome", ['result'])
+ARP_REQUESTS_SENT = Counter('spynet_arp_requests_sent_total', "ARP requests sent")
+ARP_REPLIES = Counter('spynet_arp_replies_total', "ARP replies received")
+ARP_PHASE_SECONDS = Histogram('spynet_arp_phase_seconds', "Duration of one ARP sweep")
+HOST_SCAN_SECONDS = Histogram('spynet_host_port_scan_seconds', "Port scan duration per host")
+SCAN_CYCLE_SECONDS = Histogram('spynet_scan_cycle_seconds', "Duration of a full scan cycle")
+DB_COMMIT_SECONDS = Histogram('spynet_db_commit_seconds', "Database commit latency")
+VENDOR_LOOKUP_SECONDS = Histogram('spynet_vendor_lookup_seconds', "MAC vendor lookup latency", ['source'])
+EMIT_BYTES = Histogram('spynet_socketio_emit_bytes', "Serialized size of Socket.IO emits", ['event'],
+                       buckets=SIZE_BUCKETS)
+EMIT_SECONDS = Histogram('spynet_socketio_emit_seconds', "Time spent emitting Socket.IO events", ['event'])
+BANNER_GRAB_SECONDS = Histogram('spynet_banner_grab_seconds', "Banner grab duration", ['result'])
+BANNER_LOOKUPS = Counter('spynet_banner_lookups_total', "On-demand banner requests by where the answer came from",
+                         ['source'])
+ACTIVE_SCAN_TASKS = Gauge('spynet_active_scan_tasks', "Scan tasks currently running on the scheduler")
+QUEUED_SCAN_TASKS = Gauge('spynet_queued_scan_tasks', "Scan tasks waiting in the scheduler queue")
+THREADS = Gauge('spynet_threads', "Live threads in the server process")
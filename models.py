@@ -1,6 +1,6 @@
 # models.py
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -14,7 +14,92 @@ class Host(Base):
     hostname = Column(String, default="")        # Custom hostname
     is_dhcp = Column(Boolean, default=False)       # DHCP flag
     last_seen = Column(DateTime, default=datetime.utcnow)
-    port_scan_result = Column(String, default="")  # e.g., comma-separated list of ports
+    port_scan_result = Column(String, default="")  # legacy comma-separated ports, migrated into the ports table
 
     def __repr__(self):
         return f"<Host(ip={self.ip}, mac={self.mac}, vendor={self.vendor}, hostname={self.hostname}, is_dhcp={self.is_dhcp})>"
+
+class VendorCache(Base):
+    __tablename__ = 'vendor_cache'
+    mac = Column(String, primary_key=True)
+    vendor = Column(String, nullable=False)
+    source = Column(String, default="ieee")        # "ieee" (local registry) or "api" (macvendors.com)
+    updated = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<VendorCache(mac={self.mac}, vendor={self.vendor}, source={self.source})>"
+
+class Port(Base):
+    __tablename__ = 'ports'
+    ip = Column(String, primary_key=True)
+    port = Column(Integer, primary_key=True)
+    protocol = Column(String, primary_key=True, default="tcp")
+    state = Column(String, default="open")         # state at the last scan that covered this port
+    first_seen = Column(DateTime, default=datetime.utcnow)
+    last_seen = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_ports_port_state', 'port', 'state'),
+        Index('ix_ports_last_seen', 'last_seen'),
+    )
+
+    def __repr__(self):
+        return f"<Port(ip={self.ip}, port={self.port}/{self.protocol}, state={self.state})>"
+
+class ScanObservation(Base):
+    """
+    Append-only history of port state changes ("open" or "closed").
+    """
+    __tablename__ = 'scan_observations'
+    id = Column(Integer, primary_key=True)
+    ip = Column(String, nullable=False)
+    port = Column(Integer, nullable=False)
+    protocol = Column(String, default="tcp")
+    state = Column(String, nullable=False)
+    observed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index('ix_observations_observed_at', 'observed_at'),
+        Index('ix_observations_ip_observed_at', 'ip', 'observed_at'),
+        Index('ix_observations_port_observed_at', 'port', 'observed_at'),
+    )
+
+    def __repr__(self):
+        return f"<ScanObservation(ip={self.ip}, port={self.port}/{self.protocol}, state={self.state}, observed_at={self.observed_at})>"
+
+class Banner(Base):
+    """
+    Last banner grabbed from one port, with certificate details for TLS
+    services. Entries older than enrich.BANNER_TTL are grabbed again.
+    """
+    __tablename__ = 'banners'
+    ip = Column(String, primary_key=True)
+    port = Column(Integer, primary_key=True)
+    protocol = Column(String, primary_key=True, default="tcp")
+    service = Column(String, default="")           # guessed from the banner and port, e.g. "ssh"
+    banner = Column(String, default="")
+    tls = Column(Boolean, default=False)
+    cert_subject = Column(String)
+    cert_issuer = Column(String)
+    cert_not_after = Column(DateTime)
+    cert_san = Column(String)                      # comma-separated subjectAltName entries
+    error = Column(String)                         # why the grab failed, if it did
+    grabbed_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Banner(ip={self.ip}, port={self.port}/{self.protocol}, service={self.service}, grabbed_at={self.grabbed_at})>"
+
+class ScanCoverage(Base):
+    """
+    Rotating-window position of the incremental port scan for one host.
+    """
+    __tablename__ = 'scan_coverage'
+    ip = Column(String, primary_key=True)
+    range_start = Column(Integer, nullable=False)
+    range_end = Column(Integer, nullable=False)
+    cursor = Column(Integer, default=0)            # offset into the range where the next window starts
+    passes = Column(Integer, default=0)            # completed sweeps of the full range
+    updated = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ScanCoverage(ip={self.ip}, range={self.range_start}-{self.range_end}, cursor={self.cursor}, passes={self.passes})>"
@@ -0,0 +1,173 @@
+# oui.py
+import bisect
+import csv
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+
+# IEEE registry exports (https://standards-oui.ieee.org/): MA-L, MA-M and MA-S.
+DATA_DIR = os.environ.get('SPYNET_OUI_DIR', os.path.dirname(os.path.abspath(__file__)))
+SOURCE_FILES = ['oui.csv', 'mam.csv', 'oui36.csv']
+INDEX_FILE = 'oui.idx'
+
+# Prefix lengths in bits, longest first so the first hit is the longest match.
+PREFIX_BITS = (36, 28, 24)
+MAGIC = b'OUI1'
+HEADER = struct.Struct('=4sIIII')  # magic, count36, count28, count24, name count
+
+
+def mac_to_int(mac):
+    """
+    Converts a MAC address in any common notation to a 48-bit integer.
+    Returns None if it cannot be parsed.
+    """
+    digits = ''.join(c for c in mac if c not in ':-. ')
+    if len(digits) != 12:
+        return None
+    try:
+        return int(digits, 16)
+    except ValueError:
+        return None
+
+
+def read_registry(path):
+    """
+    Yields (bits, prefix, organization) for each row of an IEEE registry CSV.
+    """
+    with open(path, newline='', encoding='utf-8', errors='replace') as f:
+        for row in csv.DictReader(f):
+            assignment = (row.get('Assignment') or '').strip()
+            name = (row.get('Organization Name') or '').strip()
+            bits = len(assignment) * 4
+            if bits not in PREFIX_BITS or not name:
+                continue
+            try:
+                yield bits, int(assignment, 16), name
+            except ValueError:
+                continue
+
+
+def build_index(sources, out_path):
+    """
+    Builds the binary prefix index from registry CSV files.
+    Layout: header, then for each prefix length a sorted uint64 prefix array
+    and a parallel uint32 name-id array, then a uint32 offset table and the
+    UTF-8 name blob. Returns the number of prefixes written.
+    """
+    names = {}
+    tables = {bits: {} for bits in PREFIX_BITS}
+    for path in sources:
+        for bits, prefix, name in read_registry(path):
+            tables[bits][prefix] = names.setdefault(name, len(names))
+
+    blob = bytearray()
+    offsets = array('I')
+    for name in names:
+        offsets.append(len(blob))
+        blob += name.encode('utf-8')
+    offsets.append(len(blob))
+
+    # A private temp file, as several processes may build the index at once.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(out_path)), prefix=INDEX_FILE + '.')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, *(len(tables[bits]) for bits in PREFIX_BITS), len(names)))
+        for bits in PREFIX_BITS:
+            prefixes = sorted(tables[bits])
+            f.write(array('Q', prefixes).tobytes())
+            f.write(array('I', (tables[bits][p] for p in prefixes)).tobytes())
+        f.write(offsets.tobytes())
+        f.write(bytes(blob))
+    try:
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, out_path)
+    except OSError:
+        os.unlink(tmp_path)
+        raise
+    return sum(len(t) for t in tables.values())
+
+
+class OuiDatabase:
+    """
+    Longest-prefix vendor lookup over a memory-mapped index file.
+    The index is opened on first use and rebuilt when a registry CSV is newer.
+    """
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.index_path = os.path.join(data_dir, INDEX_FILE)
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.mm = None
+        self.tables = {}
+        self.offsets = None
+        self.blob_start = 0
+
+    def _sources(self):
+        paths = [os.path.join(self.data_dir, name) for name in SOURCE_FILES]
+        return [p for p in paths if os.path.exists(p)]
+
+    def _index_is_stale(self, sources):
+        if not os.path.exists(self.index_path):
+            return True
+        built = os.path.getmtime(self.index_path)
+        return any(os.path.getmtime(p) > built for p in sources)
+
+    def _load(self):
+        sources = self._sources()
+        if sources and self._index_is_stale(sources):
+            count = build_index(sources, self.index_path)
+            print(f"[+] Built OUI index with {count} prefixes")
+        if not os.path.exists(self.index_path):
+            print("[-] No OUI registry found; local vendor lookup disabled")
+            return
+        with open(self.index_path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, *counts, name_count = HEADER.unpack_from(self.mm)
+        if magic != MAGIC:
+            print("[-] OUI index has an unknown format; local vendor lookup disabled")
+            return
+        view = memoryview(self.mm)
+        pos = HEADER.size
+        for bits, count in zip(PREFIX_BITS, counts):
+            prefixes = view[pos:pos + 8 * count].cast('Q')
+            pos += 8 * count
+            ids = view[pos:pos + 4 * count].cast('I')
+            pos += 4 * count
+            self.tables[bits] = (prefixes, ids)
+        self.offsets = view[pos:pos + 4 * (name_count + 1)].cast('I')
+        self.blob_start = pos + 4 * (name_count + 1)
+
+    def lookup(self, mac):
+        """
+        Returns the registered organization for mac, or None.
+        """
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    self._load()
+                    self.loaded = True
+        value = mac_to_int(mac)
+        if value is None or not self.tables:
+            return None
+        for bits in PREFIX_BITS:
+            prefixes, ids = self.tables[bits]
+            key = value >> (48 - bits)
+            i = bisect.bisect_left(prefixes, key)
+            if i < len(prefixes) and prefixes[i] == key:
+                name_id = ids[i]
+                start = self.blob_start + self.offsets[name_id]
+                end = self.blob_start + self.offsets[name_id + 1]
+                return self.mm[start:end].decode('utf-8')
+        return None
+
+
+if __name__ == '__main__':
+    # Usage: python oui.py [oui.csv mam.csv oui36.csv ...]
+    sources = sys.argv[1:] or OuiDatabase()._sources()
+    if not sources:
+        sys.exit(f"No registry CSV files found in {DATA_DIR}")
+    out = os.path.join(DATA_DIR, INDEX_FILE)
+    print(f"[+] Wrote {build_index(sources, out)} prefixes to {out}")
@@ -0,0 +1,91 @@
+# passive.py
+from scapy.config import conf
+from scapy.error import Scapy_Exception
+from scapy.layers.dhcp import BOOTP, DHCP
+from scapy.layers.l2 import ARP
+from scapy.sendrecv import AsyncSniffer
+
+# ARP requests and replies (gratuitous ARP included) and DHCP server/client traffic.
+SNIFF_FILTER = "arp or (udp and (port 67 or port 68))"
+DHCP_ACK = 5
+
+
+def _dhcp_options(packet):
+    return dict(o for o in packet[DHCP].options if isinstance(o, tuple) and len(o) == 2)
+
+
+def parse_packet(packet):
+    """
+    Returns (ip, mac, is_dhcp) for a packet that shows a host is present,
+    or None. is_dhcp is True for a DHCP lease and None when unknown.
+    """
+    if ARP in packet:
+        arp = packet[ARP]
+        # ARP probes (RFC 5227) come from 0.0.0.0 before an address is claimed.
+        if arp.op in (1, 2) and arp.psrc != "0.0.0.0":
+            return arp.psrc, arp.hwsrc.lower(), None
+    elif DHCP in packet and BOOTP in packet:
+        if _dhcp_options(packet).get('message-type') == DHCP_ACK and packet[BOOTP].yiaddr != "0.0.0.0":
+            mac = ':'.join(f"{b:02x}" for b in bytes(packet[BOOTP].chaddr)[:6])
+            return packet[BOOTP].yiaddr, mac, True
+    return None
+
+
+def local_addresses():
+    """
+    Returns (IPv4 addresses, MACs) of this machine's interfaces.
+    """
+    ips, macs = set(), set()
+    for iface in (conf.ifaces or {}).values():
+        ips.update(iface.ips.get(4, []))
+        if iface.mac:
+            macs.add(iface.mac.lower())
+    return ips, macs
+
+
+class PassiveListener:
+    """
+    Sniffs ARP (including gratuitous ARP) and DHCP acknowledgements and
+    reports hosts to the NetworkScanner the moment they appear. Hosts new
+    to the scanner get a port scan queued right away. Packets from this
+    machine's own interfaces are ignored. Requires root.
+    """
+    def __init__(self, scanner, iface=None):
+        self.scanner = scanner
+        self.iface = iface
+        self.sniffer = None
+        self.local_ips, self.local_macs = set(), set()
+
+    def start(self):
+        self.local_ips, self.local_macs = local_addresses()
+        try:
+            self.sniffer = AsyncSniffer(iface=self.iface, filter=SNIFF_FILTER, prn=self.handle, store=False)
+            self.sniffer.start()
+        except Scapy_Exception as e:
+            # No BPF compiler available; filter in Python instead.
+            print(f"[-] Kernel packet filter unavailable ({e}); filtering passively sniffed packets in Python")
+            self.sniffer = AsyncSniffer(iface=self.iface, lfilter=lambda p: ARP in p or DHCP in p,
+                                        prn=self.handle, store=False)
+            self.sniffer.start()
+        print(f"[+] Passive discovery listening on {self.iface or 'the default interface'}")
+
+    def stop(self):
+        if self.sniffer is not None and self.sniffer.running:
+            self.sniffer.stop(join=False)
+        self.sniffer = None
+
+    def handle(self, packet):
+        try:
+            seen = parse_packet(packet)
+            if seen is None:
+                return
+            ip, mac, is_dhcp = seen
+            if ip in self.local_ips or mac in self.local_macs:
+                return
+            if not self.scanner.in_scope(ip):
+                return
+            if self.scanner.observe_host(ip, mac, is_dhcp) == 'new':
+                print(f"[+] Passive discovery found new host {ip} ({mac})")
+                self.scanner.queue_port_scan(ip)
+        except Exception as e:
+            print(f"[-] Passive discovery failed on a packet: {e}")
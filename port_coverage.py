@@ -0,0 +1,119 @@
+# port_coverage.py
+import threading
+from datetime import datetime, timedelta
+from models import ScanCoverage, ScanObservation
+from db import session_scope, insert
+
+# Ports rechecked on every incremental cycle in addition to the window.
+POPULAR_PORTS = [21, 22, 23, 25, 53, 80, 110, 135, 139, 143, 443, 445, 993, 995, 3389,
+                 8000, 8080, 8443, 9000, 9001, 9443]
+
+
+class PortCoverage:
+    """
+    Spreads a wide port range over several scan cycles. Each cycle a host is
+    scanned on the next window of the range plus its known-open ports, ports
+    that changed state recently and the popular ports, so the full range is
+    covered every len(range) / window cycles while the work per cycle stays
+    bounded. Window positions are stored in the scan_coverage table.
+    """
+    def __init__(self, window=4096):
+        self.window = window
+        self.lock = threading.Lock()
+        self.state = None  # ip -> [range_start, range_end, cursor, passes]
+
+    def _load(self):
+        self.state = {}
+        with session_scope() as session:
+            for row in session.query(ScanCoverage).all():
+                self.state[row.ip] = [row.range_start, row.range_end, row.cursor, row.passes]
+
+    def reload(self):
+        """
+        Drops the cached window positions so they are read again from the
+        database, after other processes (shard workers) advanced them.
+        """
+        with self.lock:
+            self.state = None
+
+    def recently_changed(self, ips, since):
+        """
+        Returns ip -> set of ports with a state change recorded after since,
+        for the given ips or, with ips=None, for every host in one query.
+        """
+        changed = {}
+        if ips is not None and not ips:
+            return changed
+        with session_scope() as session:
+            rows = session.query(ScanObservation.ip, ScanObservation.port).filter(
+                ScanObservation.observed_at > since)
+            if ips is not None:
+                rows = rows.filter(ScanObservation.ip.in_(list(ips)))
+            for ip, port in rows:
+                changed.setdefault(ip, set()).add(port)
+        return changed
+
+    def plan(self, ips, port_range, known_open, recent_window, changed=None):
+        """
+        Returns ip -> sorted list of ports to scan this cycle for every ip.
+        known_open maps ip -> ports currently believed open; recent_window is
+        how far back (in seconds) a state change counts as recent. changed
+        may pass in recently_changed() fetched once for many calls.
+        """
+        start, end = port_range
+        size = end - start + 1
+        if size <= self.window:
+            ports = list(range(start, end + 1))
+            return {ip: ports for ip in ips}
+        if changed is None:
+            changed = self.recently_changed(ips, datetime.utcnow() - timedelta(seconds=recent_window))
+        popular = {p for p in POPULAR_PORTS if start <= p <= end}
+        plans = {}
+        with self.lock:
+            if self.state is None:
+                self._load()
+            for ip in ips:
+                entry = self.state.get(ip)
+                if entry is None or entry[0] != start or entry[1] != end:
+                    # New host or a new range: start from the beginning.
+                    entry = self.state[ip] = [start, end, 0, 0]
+                cursor = entry[2]
+                window = {start + (cursor + i) % size for i in range(self.window)}
+                extra = {p for p in known_open.get(ip, ()) if start <= p <= end}
+                extra |= {p for p in changed.get(ip, ()) if start <= p <= end}
+                plans[ip] = sorted(window | extra | popular)
+        return plans
+
+    def advance(self, ips):
+        """
+        Moves the window forward for hosts whose scan completed and saves the
+        new positions in one transaction.
+        """
+        rows = []
+        now = datetime.utcnow()
+        with self.lock:
+            if self.state is None:
+                self._load()
+            for ip in ips:
+                entry = self.state.get(ip)
+                if entry is None:
+                    continue
+                size = entry[1] - entry[0] + 1
+                if size <= self.window:
+                    continue
+                cursor = entry[2] + self.window
+                if cursor >= size:
+                    entry[3] += 1
+                entry[2] = cursor % size
+                rows.append({'ip': ip, 'range_start': entry[0], 'range_end': entry[1],
+                             'cursor': entry[2], 'passes': entry[3], 'updated': now})
+        if not rows:
+            return
+        stmt = insert(ScanCoverage)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ScanCoverage.ip],
+            set_={'range_start': stmt.excluded.range_start, 'range_end': stmt.excluded.range_end,
+                  'cursor': stmt.excluded.cursor, 'passes': stmt.excluded.passes,
+                  'updated': stmt.excluded.updated})
+        with session_scope() as session:
+            session.execute(stmt, rows)
@@ -1,8 +1,62 @@
 # port_scanner.py
-from scapy.all import IP, TCP, sr1
-import threading
+import os
+import queue
 import socket
-import ssl
+import time
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+from syn_engine import SynScanEngine
+from connect_scanner import ConnectScanEngine
+from scheduler import ScanScheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from metrics import HOST_SCAN_SECONDS, ACTIVE_SCAN_TASKS, QUEUED_SCAN_TASKS
+
+# Ports per scheduled task. Large scans are split so interactive work can
+# overtake a long background sweep between chunks.
+CHUNK_SIZE = 1024
+
+# One scheduler and one engine of each kind per process: every scan shares
+# the worker pool, the packet budget, the raw sockets and the receiver thread.
+scan_scheduler = ScanScheduler()
+engine = SynScanEngine(rate_limiter=scan_scheduler.rate_limiter)
+# Unprivileged alternative: full TCP handshakes from one event loop thread.
+connect_engine = ConnectScanEngine(rate_limiter=scan_scheduler.rate_limiter)
+ENGINES = {'syn': engine, 'connect': connect_engine}
+# SYN scans need raw sockets, so without root scans fall back to connect().
+DEFAULT_ENGINE = 'syn' if os.geteuid() == 0 else 'connect'
+ACTIVE_SCAN_TASKS.set_function(lambda: scan_scheduler.active)
+QUEUED_SCAN_TASKS.set_function(scan_scheduler.pending)
+
+def set_scan_rate(rate):
+    """
+    Sets the packets-per-second budget shared by all scans.
+    """
+    scan_scheduler.rate_limiter.set_rate(rate)
+
+def set_connect_in_flight(max_in_flight):
+    """
+    Sets how many connection attempts the connect engine keeps open at once.
+    """
+    connect_engine.set_max_in_flight(max_in_flight)
+
+def get_engine(name=None):
+    """
+    Returns the scan engine called name ('syn' or 'connect'), or the default
+    one for this process. Raises ValueError for unknown names.
+    """
+    name = name or DEFAULT_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"unknown scan engine {name!r}; expected one of {', '.join(ENGINES)}")
+    return ENGINES[name]
+
+def resolve_target(host):
+    """
+    Returns the IPv4 address for host, an address or a hostname. Raises
+    ValueError if it does not resolve to one.
+    """
+    try:
+        return socket.gethostbyname(host)
+    except (OSError, UnicodeError) as e:
+        raise ValueError(f"cannot resolve {host!r} to an IPv4 address: {e}")
 
 def syn_scan(target, port, timeout=1):
     """
@@ -10,93 +64,101 @@ def syn_scan(target, port, timeout=1):
     Sends a SYN packet and checks for a SYN-ACK reply.
     Returns True if the port appears open.
     """
-    packet = IP(dst=target)/TCP(dport=port, flags="S")
-    response = sr1(packet, timeout=timeout, verbose=0)
-    if response is None:
-        return False
-    if response.haslayer(TCP):
-        tcp_layer = response.getlayer(TCP)
-        # 0x12 == SYN-ACK; 0x14 == RST-ACK (closed)
-        if tcp_layer.flags == 0x12:
-            # Send RST to gracefully close the half-open connection.
-            rst_pkt = IP(dst=target)/TCP(dport=port, flags="R")
-            sr1(rst_pkt, timeout=timeout, verbose=0)
-            return True
-    return False
+    return port in engine.scan({target: [port]}, timeout=timeout)[target]
+
+def _chunks(ports):
+    ports = list(ports)
+    for i in range(0, len(ports), CHUNK_SIZE):
+        yield ports[i:i + CHUNK_SIZE]
 
-def scan_ports_for_host(host, ports, timeout=1):
+def submit_port_scan(host, ports, timeout=1, priority=PRIORITY_INTERACTIVE, cancel=None, on_open=None,
+                     engine=None):
     """
-    Scans a list of ports on the given host using threads.
-    Returns a list of open ports.
+    Queues a port scan of host on the scheduler, using the named engine
+    (see get_engine). Returns a list of futures, one per chunk of ports.
+    cancel and on_open are passed on to the engine's scan() for every chunk.
     """
-    open_ports = []
-    threads = []
-    lock = threading.Lock()
+    scan_engine = get_engine(engine)
 
-    print(f"[+] Starting port scan on host: {host}")
-    def scan_port(port):
-        if syn_scan(host, port, timeout):
-            with lock:
-                open_ports.append(port)
+    def scan_chunk(chunk):
+        return scan_engine.scan({host: chunk}, timeout=timeout, cancel=cancel, on_open=on_open)[host]
+    return [scan_scheduler.submit(host, scan_chunk, chunk, priority=priority) for chunk in _chunks(ports)]
 
-    for port in ports:
-        t = threading.Thread(target=scan_port, args=(port,))
-        t.start()
-        threads.append(t)
-    for t in threads:
-        t.join()
-    return open_ports
-
-def grab_banner(host, port, timeout=2):
+def scan_hosts(targets, timeout=1, priority=PRIORITY_BACKGROUND, engine=None):
     """
-    Attempts to connect to host:port and read a banner.
-    If no banner is initially received, it sends a protocol-specific probe.
-    For SSL ports, certificate verification is disabled to allow self-signed certificates.
+    Scans several hosts through the scheduler. targets maps ip -> list of ports.
+    Returns a mapping of ip -> sorted list of open ports.
     """
-    print(f"[+] Grabbing port {port} for host {host}")
+    futures = {ip: submit_port_scan(ip, ports, timeout, priority, engine=engine) for ip, ports in targets.items()}
+    return {ip: sorted(port for f in fs for port in f.result()) for ip, fs in futures.items()}
 
-    # Define known SSL ports
-    ssl_ports = {443, 465, 993, 995, 990, 636, 8443}
+# Seconds between checks for new hosts while port scans are running.
+FEED_POLL = 0.1
 
-    try:
-        # Use an unverified SSL context for ports requiring SSL (e.g., 443)
-        if port in ssl_ports:
-            context = ssl._create_unverified_context()
-            sock = socket.create_connection((host, port), timeout=timeout)
-            s = context.wrap_socket(sock, server_hostname=host)
-        else:
-            s = socket.create_connection((host, port), timeout=timeout)
-        
-        s.settimeout(timeout)
-        try:
-            banner = s.recv(1024)
-        except socket.timeout:
-            banner = b""
-        
-        # If no banner is returned, send a protocol-specific probe
-        if not banner:
-            probes = {
-                80: f"GET / HTTP/1.1\r\nHost: {host}\r\n\r\n",
-                443: f"GET / HTTP/1.1\r\nHost: {host}\r\n\r\n",
-                8443: f"GET / HTTP/1.1\r\nHost: {host}\r\n\r\n",
-                21: "\r\n",               # FTP
-                25: "EHLO example.com\r\n",# SMTP
-                465: "EHLO example.com\r\n",# SMTP over SSL
-                110: "\r\n",              # POP3
-                995: "\r\n",              # POP3S
-                143: "\r\n",              # IMAP
-                993: "\r\n",              # IMAPS
-                636: "\r\n",              # LDAPS
-                990: "\r\n",              # Implicit FTPS
-            }
-            if port in probes:
-                try:
-                    s.sendall(probes[port].encode('utf-8'))
-                    banner = s.recv(1024)
-                except Exception as e:
-                    print(f"[-] Error sending probe: {e}")
-        s.close()
-        result = banner.decode('utf-8', errors='ignore').strip() if banner else "No banner received."
-        return result
-    except Exception as e:
-        return str(e)
\ No newline at end of file
+def iter_host_scans(plans, timeout=1, priority=PRIORITY_BACKGROUND, in_flight=16, on_start=None, engine=None):
+    """
+    Port scans many hosts through the scheduler with at most in_flight hosts
+    queued at once. plans maps ip -> list of ports, or is a queue.Queue of
+    (ip, ports) items ending with None for hosts still being discovered.
+    on_start(ip) is called as each host is queued. Yields
+    (ip, open_ports, complete) as soon as a host finishes; complete is False
+    if any of its chunks failed. engine names the scan engine to use.
+    """
+    feed = plans if isinstance(plans, queue.Queue) else None
+    queued = deque() if feed is not None else deque(plans.items())
+    chunks = {}     # chunk future -> ip
+    remaining = {}  # ip -> number of unfinished chunks
+    found = {}      # ip -> open ports found so far
+    started = {}    # ip -> time the host was queued
+    failed = set()
+    while queued or chunks or feed is not None:
+        if feed is not None:
+            # Block for new hosts only when there is nothing else to wait for.
+            block = not queued and not chunks
+            try:
+                while True:
+                    item = feed.get(block=block)
+                    block = False
+                    if item is None:
+                        feed = None
+                        break
+                    queued.append(item)
+            except queue.Empty:
+                pass
+        while queued and len(remaining) < in_flight:
+            ip, ports = queued.popleft()
+            if on_start:
+                on_start(ip)
+            futures = submit_port_scan(ip, ports, timeout=timeout, priority=priority, engine=engine)
+            if not futures:
+                yield ip, [], True
+                continue
+            remaining[ip] = len(futures)
+            found[ip] = []
+            started[ip] = time.perf_counter()
+            for f in futures:
+                chunks[f] = ip
+        if not chunks:
+            continue
+        done, _ = wait(list(chunks), timeout=FEED_POLL if feed is not None else None, return_when=FIRST_COMPLETED)
+        for f in done:
+            ip = chunks.pop(f)
+            try:
+                found[ip].extend(f.result())
+            except Exception as e:
+                print(f"[-] Port scan of {ip} failed: {e}")
+                failed.add(ip)
+            remaining[ip] -= 1
+            if not remaining[ip]:
+                del remaining[ip]
+                HOST_SCAN_SECONDS.observe(time.perf_counter() - started.pop(ip))
+                yield ip, sorted(found.pop(ip)), ip not in failed
+                failed.discard(ip)
+
+def scan_ports_for_host(host, ports, timeout=1, priority=PRIORITY_INTERACTIVE, engine=None):
+    """
+    Scans a list of ports on the given host through the scan scheduler.
+    Returns a list of open ports.
+    """
+    print(f"[+] Starting port scan on host: {host}")
+    return scan_hosts({host: ports}, timeout, priority, engine)[host]
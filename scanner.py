@@ -1,33 +1,173 @@
 # scanner.py
 import time
 import threading
-from arp_scanner import arp_scan
-from port_scanner import scan_ports_for_host
+import queue
+import ipaddress
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from arp_scanner import iter_arp_scan, add_vendor_listener, lookup_vendor
+from port_scanner import iter_host_scans, set_scan_rate, set_connect_in_flight, DEFAULT_ENGINE
+from shard_worker import scan_shard, shard_networks
+from scheduler import PRIORITY_BACKGROUND
 from models import Host
 from sqlalchemy.orm.exc import NoResultFound
-from datetime import datetime
-from db import db_session  # Import the db_session from server.py
-from helper import filter_numeric_ports
+from datetime import datetime, timedelta
+from db import (session_scope, upsert_arp_results, save_port_results, save_vendor, load_open_ports,
+                save_host_fields, BATCH_SIZE)
+from helper import filter_numeric_ports, ranges_to_ports
+from port_coverage import PortCoverage
+from enrich import enricher
+from host_store import HostRecord, HostSnapshot, ports_to_bitmap
+from metrics import ARP_PHASE_SECONDS, SCAN_CYCLE_SECONDS
+
+# Number of host changes kept for delta updates. Clients further behind than
+# this get a full snapshot instead.
+CHANGE_LOG_SIZE = 5000
+# With passive discovery on, active sweeps only run every
+# scan_interval * PASSIVE_BACKSTOP seconds to catch silent hosts.
+PASSIVE_BACKSTOP = 5
+# A host seen passively is only written again after this many seconds,
+# unless something about it changed.
+PASSIVE_REFRESH = 30
+
+def _is_port(value):
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= 65535
+
+
+def _check_ipv4(value, what):
+    if not isinstance(value, str):
+        raise ValueError(f"{what} must be an IPv4 address string")
+    try:
+        ipaddress.IPv4Address(value)
+    except ValueError:
+        raise ValueError(f"{what} {value!r} is not an IPv4 address")
+
+
+def check_ingest_batch(batch):
+    """
+    Raises ValueError unless batch has the shape NetworkScanner.ingest expects.
+    """
+    def entries(key, fields):
+        value = batch.get(key, [])
+        if not isinstance(value, list) or not all(isinstance(e, dict) for e in value):
+            raise ValueError(f"'{key}' must be a list of objects")
+        for entry in value:
+            missing = [field for field in fields if field not in entry]
+            if missing:
+                raise ValueError(f"'{key}' entry is missing {', '.join(missing)}")
+        return value
+
+    if not isinstance(batch, dict):
+        raise ValueError("batch must be a JSON object")
+    for host in entries('arp', ('ip', 'mac', 'vendor')):
+        _check_ipv4(host['ip'], "'arp' ip")
+        for field in ('mac', 'vendor'):
+            if host[field] is not None and not isinstance(host[field], str):
+                raise ValueError(f"'arp' {field} must be a string")
+    for entry in entries('networks', ('network',)):
+        if not isinstance(entry['network'], str):
+            raise ValueError("'networks' network must be a CIDR string")
+        ipaddress.ip_network(entry['network'], strict=False)
+        live = entry.get('live', [])
+        if not isinstance(live, list):
+            raise ValueError("'networks' live must be a list of IPv4 addresses")
+        for ip in live:
+            _check_ipv4(ip, "'networks' live entry")
+    for entry in entries('ports', ('ip',)):
+        _check_ipv4(entry['ip'], "'ports' ip")
+        open_ports, scanned = entry.get('open', []), entry.get('scanned', [])
+        if not isinstance(open_ports, list) or not all(_is_port(p) for p in open_ports):
+            raise ValueError("'ports' open must be a list of port numbers")
+        if not isinstance(scanned, list) or not all(
+                isinstance(r, list) and len(r) == 2 and all(_is_port(p) for p in r) and r[0] <= r[1]
+                for r in scanned):
+            raise ValueError("'ports' scanned must be a list of [start, end] port ranges with start <= end")
+
 
 class NetworkScanner:
     def __init__(self):
         self.network = None
+        self.networks = []  # CIDRs to scan; self.network is their display form
+        self.scope = []  # self.networks as ip_network objects
+        self.workers = 1  # worker processes; above 1 the networks are sharded
+        self.shard_prefix = 24  # networks larger than this are split into shards of this size
+        self.pool = None
+        self.pool_workers = 0
+        self.manager = None  # multiprocessing manager serving self.results
+        self.results = None
         self.port_range = (1, 1024)
         self.timeout = 2
         self.scan_interval = 60
-        self.hosts = {}
+        self.rate = 10000  # probes per second
+        self.engine = DEFAULT_ENGINE  # 'syn' (needs root) or 'connect'
+        self.hosts_in_flight = 16  # hosts port scanned concurrently
+        self.incremental = False  # spread port_range over several cycles
+        self.coverage = PortCoverage()
+        self.passive = None  # PassiveListener while passive discovery is on
+        self.discovered = None  # queue of (ip, ports) for hosts found between cycles
+        self.discovered_plans = {}  # ip -> ports queued on self.discovered
+        self.hosts = {}  # ip -> HostRecord; records are replaced, never modified
+        self.snapshot_cache = None  # HostSnapshot of self.hosts, rebuilt after changes
+        self.listeners = []  # callables(ip, host_dict) notified when a host changes
+        self.revision = 0  # bumped on every change to self.hosts
+        self.changes = deque(maxlen=CHANGE_LOG_SIZE)  # (revision, ip, op)
+        self.last_cycle_started = None
+        self.last_cycle_duration = None
         self.lock = threading.Lock()
         self.scanning_active = False
         self.scanning_paused = False
-        self.load_from_db() #load persistent data into memory
+        # Hosts load from the database in the background so the server can
+        # answer right away; loaded is set once they are all in memory.
+        self.loaded = threading.Event()
+        threading.Thread(target=self.load_from_db, daemon=True).start()
+        add_vendor_listener(self.apply_vendor)
 
-    def start(self, network, port_range, timeout, scan_interval):
-        print(f"[+] Start continious scanning for network: {network}")
+    def start(self, network, port_range, timeout, scan_interval, rate=None, hosts_in_flight=None,
+              incremental=None, ports_per_cycle=None, workers=None, shard_prefix=None,
+              passive=None, iface=None, engine=None, max_in_flight=None):
+        """
+        network is one CIDR, a comma-separated string of CIDRs or a list of them.
+        passive turns on ARP/DHCP sniffing on iface (see passive.py).
+        engine picks the port scan engine; max_in_flight caps open connection
+        attempts when it is 'connect'.
+        """
+        if isinstance(network, str):
+            network = [n.strip() for n in network.split(',') if n.strip()]
+        print(f"[+] Start continious scanning for network: {', '.join(network)}")
         print(f"[+] the scan will repeat itself every {scan_interval} seconds.")
-        self.network = network
+        self.networks = list(network)
+        self.scope = [ipaddress.ip_network(n, strict=False) for n in self.networks]
+        self.network = ', '.join(self.networks)
         self.port_range = port_range
         self.timeout = timeout
         self.scan_interval = scan_interval
+        if rate:
+            self.rate = rate
+        if hosts_in_flight:
+            self.hosts_in_flight = hosts_in_flight
+        if incremental is not None:
+            self.incremental = incremental
+        if ports_per_cycle:
+            self.coverage.window = ports_per_cycle
+        if workers:
+            self.workers = workers
+        if shard_prefix:
+            self.shard_prefix = shard_prefix
+        if engine:
+            self.engine = engine
+        if max_in_flight:
+            set_connect_in_flight(max_in_flight)
+        set_scan_rate(self.rate)
+        if passive and self.passive is None:
+            # Imported on first use so the server starts without the sniffing layers.
+            from passive import PassiveListener
+            self.passive = PassiveListener(self, iface)
+            self.passive.start()
+        elif passive is False and self.passive is not None:
+            self.passive.stop()
+            self.passive = None
         self.scanning_active = True
         self.scanning_paused = False
         threading.Thread(target=self.scan_loop, daemon=True).start()
@@ -35,94 +175,459 @@ class NetworkScanner:
     def scan_loop(self):
         while self.scanning_active:
             if not self.scanning_paused:
+                self.last_cycle_started = time.time()
                 self.scan_once()
-            time.sleep(self.scan_interval)
+                self.last_cycle_duration = time.time() - self.last_cycle_started
+                SCAN_CYCLE_SECONDS.observe(self.last_cycle_duration)
+                print(f"[+] Scan cycle took {self.last_cycle_duration:.1f} seconds.")
+                if self.last_cycle_duration > self.sweep_interval():
+                    print(f"[-] Scan cycle overran the {self.sweep_interval()} second interval.")
+            time.sleep(self.sweep_interval())
             print(f"[+] Sleep timer ended. Starting loop again.")
 
+    def sweep_interval(self):
+        """
+        Seconds between active scan cycles; longer when passive discovery
+        keeps the host list current between them.
+        """
+        return self.scan_interval * (PASSIVE_BACKSTOP if self.passive is not None else 1)
+
     def scan_once(self):
-        live_hosts = arp_scan(self.network, timeout=self.timeout)
-        print("ARP scan found", len(live_hosts), "hosts:", live_hosts)
-        live_ips = [host['ip'] for host in live_hosts]
+        if self.workers > 1:
+            return self.scan_sharded()
+        # The ARP sweep runs in its own thread and feeds each host to the port
+        # scans as soon as it answers.
+        feed = queue.Queue()
+        plans = {}  # ip -> ports to scan, filled by the sweep
+        threading.Thread(target=self.sweep, args=(feed, plans), daemon=True).start()
+
+        # Port scan up to hosts_in_flight hosts at a time on the shared
+        # scheduler, publishing each host as soon as its scan completes.
+        to_save = {}    # ip -> (scanned ports, open ports), written in one transaction at the end
+        opened = {}     # ip -> ports that were not open before this cycle
+        completed = []
+        for ip, open_ports, complete in iter_host_scans(
+                feed, timeout=self.timeout, priority=PRIORITY_BACKGROUND, in_flight=self.hosts_in_flight,
+                on_start=lambda ip: self.update_host(ip, port_scan_in_progress=True), engine=self.engine):
+            # Closed ports are only recorded for hosts whose scan fully completed.
+            self._finish_host(to_save, ip, plans[ip] if complete else open_ports, open_ports, opened)
+            if complete:
+                completed.append(ip)
+        save_port_results(to_save)
+        enricher.submit(opened)
+        if self.incremental:
+            self.coverage.advance(completed)
+
+    def sweep(self, feed, plans):
+        """
+        ARP sweeps every network, merging each host into the store as it
+        answers and putting (ip, ports) on feed for its port scan. Database
+        writes are batched. Puts None on feed when done.
+        """
+        full_range = list(range(self.port_range[0], self.port_range[1] + 1))
+        live_hosts = []
+        unsaved = []
+        try:
+            # Recent port changes of every host, read once for the whole sweep.
+            changed = self.recent_port_changes() if self.incremental else None
+            with ARP_PHASE_SECONDS.time():
+                for network in self.networks:
+                    for host in iter_arp_scan(network, timeout=self.timeout):
+                        ip = host['ip']
+                        if ip in plans:
+                            continue  # overlapping networks
+                        live_hosts.append(host)
+                        unsaved.append(host)
+                        self.merge_arp_results([host], save=False)
+                        plans[ip] = self.plan_ports(ip, full_range, changed)
+                        feed.put((ip, plans[ip]))
+                        if len(unsaved) >= BATCH_SIZE:
+                            upsert_arp_results(unsaved, datetime.utcnow())
+                            unsaved = []
+            upsert_arp_results(unsaved, datetime.utcnow())
+            print("ARP scan found", len(live_hosts), "hosts:", live_hosts)
+            self.mark_offline(plans)
+        except Exception as e:
+            print(f"[-] ARP sweep failed: {e}")
+        finally:
+            feed.put(None)
+
+    def recent_port_changes(self):
+        """
+        Returns ip -> ports that changed state within the incremental
+        recheck window, for every host.
+        """
+        since = datetime.utcnow() - timedelta(seconds=self.scan_interval * 3)
+        return self.coverage.recently_changed(None, since)
+
+    def plan_ports(self, ip, full_range=None, changed=None):
+        """
+        Returns the ports to scan on ip this cycle. full_range may pass in a
+        shared list of the whole port range, and changed the result of
+        recent_port_changes() so planning needs no query per host.
+        """
+        if self.incremental:
+            record = self.hosts.get(ip)
+            known_open = {ip: set(record.ports)} if record is not None else {}
+            return self.coverage.plan([ip], self.port_range, known_open, self.scan_interval * 3, changed)[ip]
+        return full_range or list(range(self.port_range[0], self.port_range[1] + 1))
+
+    def in_scope(self, ip):
+        """
+        True if ip is inside one of the scanned networks.
+        """
+        address = ipaddress.ip_address(ip)
+        return any(address in net for net in self.scope)
+
+    def observe_host(self, ip, mac, is_dhcp=None):
+        """
+        Records a host seen by passive discovery. Returns 'new' for a host not
+        in the store yet, 'seen' if it was updated, or None if it was already
+        online and recently seen with nothing changed.
+        """
+        record = self.hosts.get(ip)
+        dhcp_changed = is_dhcp is not None and (record is None or record.is_dhcp != is_dhcp)
+        if (record is not None and not dhcp_changed and record.status == 'online' and record.mac == mac
+                and time.time() - record.last_seen < PASSIVE_REFRESH):
+            return None
+        self.merge_arp_results([{'ip': ip, 'mac': mac, 'vendor': lookup_vendor(mac)}])
+        if dhcp_changed:
+            self.update_host(ip, is_dhcp=is_dhcp)
+            save_host_fields(ip, is_dhcp=is_dhcp)
+        else:
+            self.publish(ip)
+        return 'new' if record is None else 'seen'
+
+    def queue_port_scan(self, ip):
+        """
+        Port scans a host found between scan cycles, in the background.
+        """
+        ports = self.plan_ports(ip)
+        with self.lock:
+            if self.discovered is None:
+                self.discovered = queue.Queue()
+                threading.Thread(target=self._scan_discovered, args=(self.discovered,), daemon=True).start()
+            self.discovered_plans[ip] = ports
+        self.discovered.put((ip, ports))
+
+    def _scan_discovered(self, feed):
+        # The feed never ends, so this runs for the life of the process.
+        for ip, open_ports, complete in iter_host_scans(
+                feed, timeout=self.timeout, priority=PRIORITY_BACKGROUND, in_flight=self.hosts_in_flight,
+                on_start=lambda ip: self.update_host(ip, port_scan_in_progress=True), engine=self.engine):
+            with self.lock:
+                ports = self.discovered_plans.pop(ip, open_ports)
+            try:
+                to_save, opened = {}, {}
+                self._finish_host(to_save, ip, ports if complete else open_ports, open_ports, opened)
+                save_port_results(to_save)
+                enricher.submit(opened)
+                if self.incremental and complete:
+                    self.coverage.advance([ip])
+            except Exception as e:
+                # Keep serving the feed; the host is scanned again next cycle.
+                print(f"[-] Saving the port scan of discovered host {ip} failed: {e}")
+                self.merge_port_results(ip, [])
+
+    def scan_sharded(self):
+        """
+        Splits the configured networks into shards and scans them in a pool
+        of worker processes. Each worker runs its own ARP and port scans and
+        streams results back; they are merged here as they arrive.
+        """
+        shards = shard_networks(self.networks, self.shard_prefix)
+        if self.pool is None or self.pool_workers != self.workers:
+            self._start_pool()
+        print(f"[+] Scanning {len(shards)} shards with {self.workers} worker processes")
+        try:
+            futures = self._submit_shards(shards)
+        except BrokenProcessPool:
+            print("[-] The worker pool is broken; starting a new one")
+            self._start_pool()
+            futures = self._submit_shards(shards)
+        live_ips = set()
+        to_save = {}
+        opened = {}
+        pending = len(futures)
+        while pending:
+            try:
+                message = self.results.get(timeout=1)
+            except queue.Empty:
+                # A worker that died without reporting would otherwise hang the cycle.
+                if all(f.done() for f in futures) and self.results.empty():
+                    break
+                continue
+            kind = message[0]
+            if kind == 'arp':
+                _, shard, live_hosts = message
+                live_ips.update(host['ip'] for host in live_hosts)
+                self.merge_arp_results(live_hosts)
+            elif kind == 'scanning':
+                self.update_host(message[1], port_scan_in_progress=True)
+            elif kind == 'ports':
+                _, ip, scanned, open_ports = message
+                self._finish_host(to_save, ip, scanned, open_ports, opened)
+            elif kind == 'done':
+                pending -= 1
+                if message[2]:
+                    print(f"[-] Shard {message[1]} failed: {message[2]}")
+        if any(isinstance(f.exception(), BrokenProcessPool) for f in futures if f.done() and not f.cancelled()):
+            # A worker died; the next cycle starts a new pool.
+            print("[-] A worker process died during the scan")
+            self._shutdown_pool()
+        print("Sharded ARP scan found", len(live_ips), "hosts")
+        self.mark_offline(live_ips)
+        save_port_results(to_save)
+        enricher.submit(opened)
+        if self.incremental:
+            # The workers advanced the coverage windows in the database.
+            self.coverage.reload()
+
+    def _start_pool(self):
+        # Replaces the worker pool and the manager serving its result queue.
+        self._shutdown_pool()
+        context = multiprocessing.get_context('spawn')
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        self.pool_workers = self.workers
+        self.manager = context.Manager()
+        self.results = self.manager.Queue()
+
+    def _shutdown_pool(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.manager.shutdown()
+            self.pool = self.manager = self.results = None
+            self.pool_workers = 0
+
+    def _submit_shards(self, shards):
+        return [self.pool.submit(scan_shard, shard, self.port_range, self.timeout, self.rate / self.workers,
+                                 self.hosts_in_flight, self.incremental, self.coverage.window,
+                                 self.scan_interval * 3, self.results, self.engine)
+                for shard in shards]
+
+    def merge_arp_results(self, live_hosts, save=True):
+        """
+        Writes ARP results to the database in one transaction and merges them
+        into the in-memory host store. With save=False the caller writes them
+        itself later; new hosts then get empty manual fields, as every host
+        already in the database was loaded at startup.
+        """
+        # New hosts take their manual fields from the loaded records.
+        self.loaded.wait()
+        manual_fields = upsert_arp_results(live_hosts, datetime.utcnow()) if save else {}
+        now = time.time()
 
         with self.lock:
             for host in live_hosts:
                 ip = host['ip']
-                # Update database: try to find an existing record.
-                # Update database: try to find an existing record.
-                db_host = db_session.query(Host).filter_by(ip=ip).first()
-                if db_host:
-                    # Only update fields provided by ARP scan.
-                    db_host.mac = host['mac']
-                    # Update vendor only if the new value isn't "Unknown" or the current vendor is "Unknown"
-                    if host['vendor'] != "Unknown" or db_host.vendor == "Unknown":
-                        db_host.vendor = host['vendor']
-                    db_host.last_seen = datetime.utcnow()
-                    # Do NOT update hostname and is_dhcp (manual fields)
-                else:
-                    db_host = Host(
-                        ip=ip,
-                        mac=host['mac'],
-                        vendor=host['vendor'],
-                        last_seen=datetime.utcnow(),
-                        hostname="",  # default empty, can be manually updated later
-                        is_dhcp=False # default False
-                    )
-                    db_session.add(db_host)
-                db_session.commit()
-
-
-                # Update in-memory dictionary (which is used for live socket updates)
-                if ip not in self.hosts:
-                    self.hosts[ip] = {
-                        'mac': host['mac'],
-                        'vendor': host['vendor'],
-                        'ports': [],
-                        'status': 'online',
-                        'last_seen': time.time(),
-                        'port_scan_in_progress': False,
-                        'hostname': db_host.hostname,
-                        'is_dhcp': db_host.is_dhcp
-                    }
+                record = self.hosts.get(ip)
+                if record is None:
+                    hostname, is_dhcp = manual_fields.get(ip, ("", False))
+                    self.hosts[ip] = HostRecord(host['mac'], host['vendor'], status='online', last_seen=now,
+                                                hostname=hostname, is_dhcp=is_dhcp)
+                    self.mark_changed(ip, 'added')
                 else:
-                    self.hosts[ip]['mac'] = host['mac']
-                    self.hosts[ip]['vendor'] = host['vendor']
-                    self.hosts[ip]['status'] = 'online'
-                    self.hosts[ip]['last_seen'] = time.time()
-                    # hostname and is_dhcp remainds as they are
-
-            # Mark hosts not seen in this ARP scan as offline
-            for ip in list(self.hosts.keys()):
-                if ip not in live_ips and time.time() - self.hosts[ip]['last_seen'] > self.scan_interval * 1.5:
-                    self.hosts[ip]['status'] = 'offline'
-
-        # Optionally, perform port scanning on each live host.
-        for ip in live_ips:
-            ports = list(range(self.port_range[0], self.port_range[1] + 1))
-            with self.lock:
-                if ip in self.hosts:
-                    self.hosts[ip]['port_scan_in_progress'] = True
-            open_ports = scan_ports_for_host(ip, ports, timeout=self.timeout)
+                    # hostname and is_dhcp remain as they are
+                    self.hosts[ip] = record.replace(mac=host['mac'], vendor=host['vendor'],
+                                                    status='online', last_seen=now)
+                    self.mark_changed(ip)
+
+    def mark_offline(self, live_ips, network=None):
+        # Mark hosts not seen in this ARP scan as offline (only those inside
+        # network when a remote agent reports on its own segment)
+        live_ips = set(live_ips)
+        net = ipaddress.ip_network(network, strict=False) if network else None
+        now = time.time()
+        with self.lock:
+            for ip, record in list(self.hosts.items()):
+                if net is not None and ipaddress.ip_address(ip) not in net:
+                    continue
+                if ip not in live_ips and now - record.last_seen > self.sweep_interval() * 1.5:
+                    if record.status != 'offline':
+                        self.hosts[ip] = record.replace(status='offline')
+                        self.mark_changed(ip, 'offline')
+
+    def ingest(self, batch):
+        """
+        Merges a result batch sent by a remote agent (see agent.py):
+        {'agent', 'arp': [host], 'ports': [{'ip', 'scanned': ranges, 'open'}],
+         'networks': [{'network', 'live'}]}
+        Raises ValueError, before merging anything, if the batch is malformed.
+        """
+        check_ingest_batch(batch)
+        self.merge_arp_results(batch.get('arp', []))
+        for entry in batch.get('networks', []):
+            self.mark_offline(entry.get('live', []), entry['network'])
+        to_save = {}
+        for entry in batch.get('ports', []):
+            ip = entry['ip']
+            if ip not in self.hosts:
+                # Targets scanned without ARP discovery have no host entry yet.
+                self.update_host(ip)
+            self._finish_host(to_save, ip, ranges_to_ports(entry.get('scanned', [])), entry.get('open', []))
+        save_port_results(to_save)
+
+    def _finish_host(self, to_save, ip, ports, open_ports, opened=None):
+        # opened, if given, collects the ports that were not open before.
+        record = self.hosts.get(ip)
+        known = record.port_bits if record is not None else 0
+        if self.merge_port_results(ip, open_ports, scanned=ports):
+            to_save[ip] = (ports, open_ports)
+            new_ports = sorted(p for p in filter_numeric_ports(open_ports) if not known >> p & 1)
+            if opened is not None and new_ports:
+                opened[ip] = new_ports
+
+    def merge_port_results(self, ip, open_ports, scanned=None, in_progress=False):
+        """
+        Merges port scan results for ip into memory and notifies listeners.
+        Known ports are kept unless listed in scanned and not found open.
+        in_progress=True streams partial results of a scan still running.
+        Returns False if the host is no longer known.
+        """
+        new_bits = ports_to_bitmap(filter_numeric_ports(open_ports))
+        closed_bits = ports_to_bitmap(scanned) & ~new_bits if scanned is not None else 0
+        with self.lock:
+            record = self.hosts.get(ip)
+            if record is None:
+                return False
+            port_bits = (record.port_bits & ~closed_bits) | new_bits
+            self.hosts[ip] = record.replace(port_bits=port_bits, port_scan_in_progress=in_progress)
+            self.mark_changed(ip)
+        self.publish(ip)
+        return True
+
+    def apply_vendor(self, mac, vendor):
+        """
+        Applies a vendor resolved in the background to every host with this MAC.
+        """
+        with self.lock:
+            ips = [ip for ip, record in self.hosts.items() if (record.mac or '').lower() == mac]
+            for ip in ips:
+                self.hosts[ip] = self.hosts[ip].replace(vendor=vendor)
+                self.mark_changed(ip)
+        save_vendor(ips, vendor)
+        for ip in ips:
+            self.publish(ip)
+
+    def mark_changed(self, ip, op='changed'):
+        """
+        Records a change to self.hosts[ip]. Must be called with self.lock held.
+        op is 'added', 'changed', 'offline' or 'removed'.
+        """
+        self.revision += 1
+        self.changes.append((self.revision, ip, op))
+        self.snapshot_cache = None
+
+    def update_host(self, ip, **fields):
+        """
+        Sets fields on the in-memory host, creating a placeholder entry for
+        hosts not discovered by ARP, and notifies listeners.
+        """
+        self.loaded.wait()
+        with self.lock:
+            record = self.hosts.get(ip)
+            if record is not None:
+                self.hosts[ip] = record.replace(**fields)
+                self.mark_changed(ip)
+            else:
+                self.hosts[ip] = HostRecord(last_seen=time.time()).replace(**fields)
+                self.mark_changed(ip, 'added')
+        self.publish(ip)
+
+    def _current_snapshot(self):
+        # Called with self.lock held.
+        if self.snapshot_cache is None:
+            self.snapshot_cache = HostSnapshot(self.revision, dict(self.hosts))
+        return self.snapshot_cache
+
+    def snapshot(self):
+        """
+        Returns an immutable HostSnapshot of the store. Readers share it
+        without locking; after a change the next reader builds a new one,
+        which only copies references to the (immutable) records.
+        """
+        snapshot = self.snapshot_cache
+        if snapshot is None:
             with self.lock:
-                if ip in self.hosts:
-                    # Convert existing ports (if any) and new scan results into sets of numeric values.
-                    existing_ports = filter_numeric_ports(self.hosts[ip].get('ports', []))
-                    new_ports = filter_numeric_ports(open_ports)
-                    if new_ports:
-                        # Merge the new ports with the existing ports.
-                        merged_ports = sorted(existing_ports.union(new_ports))
-                        self.hosts[ip]['ports'] = merged_ports
-                        # Update the corresponding database record.
-                        db_host = db_session.query(Host).filter_by(ip=ip).first()
-                        if db_host:
-                            # Save as a comma-separated string.
-                            db_host.port_scan_result = ','.join(map(str, merged_ports))
-                            db_session.commit()
-                    else:
-                        # If new scan returns empty and we already have ports, leave them intact.
-                        if not existing_ports:
-                            self.hosts[ip]['ports'] = []
-                    self.hosts[ip]['port_scan_in_progress'] = False
+                snapshot = self._current_snapshot()
+        return snapshot
+
+    def get_snapshot(self):
+        """
+        Returns (revision, hosts) captured atomically, with hosts as dicts.
+        """
+        snapshot = self.snapshot()
+        return snapshot.revision, snapshot.to_dicts()
+
+    def get_host(self, ip):
+        """
+        Returns one host as a dict, or None if it is unknown.
+        """
+        record = self.hosts.get(ip)
+        return record.to_dict() if record is not None else None
+
+    def changes_since(self, revision):
+        """
+        Returns (current_revision, patches) describing every host changed after
+        revision, one patch per host: {'op', 'ip', 'host'}. Returns None when
+        revision is no longer covered by the change log and a full snapshot
+        is needed.
+        """
+        with self.lock:
+            if revision == self.revision:
+                return self.revision, []
+            if not self.changes or revision > self.revision or revision < self.changes[0][0] - 1:
+                return None
+            ops = {}
+            for rev, ip, op in self.changes:
+                if rev <= revision:
+                    continue
+                # A host added within the window stays 'added' for the client.
+                if ops.get(ip) != 'added':
+                    ops[ip] = op
+            snapshot = self._current_snapshot()
+        patches = []
+        for ip, op in ops.items():
+            record = snapshot.hosts.get(ip)
+            if record is None:
+                patches.append({'op': 'removed', 'ip': ip, 'host': None})
+            else:
+                patches.append({'op': op, 'ip': ip, 'host': record.to_dict()})
+        return snapshot.revision, patches
 
+    def add_listener(self, callback):
+        """
+        Registers callback(ip, host_dict), called whenever a host is updated.
+        """
+        self.listeners.append(callback)
+
+    def publish(self, ip):
+        host = self.get_host(ip)
+        if host is None:
+            return
+        for callback in self.listeners:
+            try:
+                callback(ip, host)
+            except Exception as e:
+                print(f"[-] Host update listener failed: {e}")
+
+    def get_status(self):
+        return {
+            'network': self.network,
+            'active': self.scanning_active,
+            'paused': self.scanning_paused,
+            'scan_interval': self.scan_interval,
+            'hosts_in_flight': self.hosts_in_flight,
+            'incremental': self.incremental,
+            'ports_per_cycle': self.coverage.window if self.incremental else None,
+            'workers': self.workers,
+            'engine': self.engine,
+            'passive': self.passive is not None,
+            'hosts_loaded': self.loaded.is_set(),
+            'last_cycle_started': self.last_cycle_started,
+            'last_cycle_duration': self.last_cycle_duration,
+            'last_cycle_overran': self.last_cycle_duration is not None and self.last_cycle_duration > self.sweep_interval(),
+        }
 
     def pause(self):
         print("[+] Pausing the scan")
@@ -135,27 +640,43 @@ class NetworkScanner:
     def stop(self):
         print("[+] Stopping the scan")
         self.scanning_active = False
+        if self.passive is not None:
+            self.passive.stop()
+            self.passive = None
 
     def get_data(self):
-        with self.lock:
-            return self.hosts.copy()
+        return self.snapshot().to_dicts()
     
     def load_from_db(self):
-        from db import db_session  # ensure we have access to the session
-        from models import Host
-        db_hosts = db_session.query(Host).all()
-        for db_host in db_hosts:
-            # Assume that port_scan_result is stored as a comma-separated string.
-            ports = db_host.port_scan_result.split(',') if db_host.port_scan_result else []
-            # Convert last_seen datetime to a timestamp (float) for our in-memory dict.
-            self.hosts[db_host.ip] = {
-                'mac': db_host.mac,
-                'vendor': db_host.vendor,
-                'ports': ports,
-                'status': 'offline',  # Mark offline until confirmed by a new ARP scan.
-                'last_seen': db_host.last_seen.timestamp(),
-                'port_scan_in_progress': False,
-                'hostname': db_host.hostname,
-                'is_dhcp': db_host.is_dhcp
-        }
+        """
+        Loads every stored host into memory, BATCH_SIZE rows at a time, so
+        readers see hosts appear while the rest are still loading. Hosts
+        stay offline until confirmed by a new ARP scan.
+        """
+        try:
+            with session_scope() as session:
+                batch = []
+                for db_host in session.query(Host).yield_per(BATCH_SIZE):
+                    batch.append(db_host)
+                    if len(batch) >= BATCH_SIZE:
+                        self._load_batch(session, batch)
+                        batch = []
+                self._load_batch(session, batch)
+        except Exception as e:
+            print(f"[-] Loading hosts from the database failed: {e}")
+        finally:
+            self.loaded.set()
 
+    def _load_batch(self, session, db_hosts):
+        if not db_hosts:
+            return
+        host_ports = load_open_ports(session, [db_host.ip for db_host in db_hosts], state="open")
+        with self.lock:
+            for db_host in db_hosts:
+                if db_host.ip in self.hosts:
+                    continue  # already updated since startup
+                ports = host_ports.get(db_host.ip, [])
+                self.hosts[db_host.ip] = HostRecord(db_host.mac, db_host.vendor, ports_to_bitmap(ports), 'offline',
+                                                    db_host.last_seen.timestamp(), False,
+                                                    db_host.hostname, db_host.is_dhcp)
+                self.mark_changed(db_host.ip, 'added')
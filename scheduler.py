@@ -0,0 +1,102 @@
+# scheduler.py
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+from congestion import RateLimiter
+
+# Lower numbers run first.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class _Task:
+    def __init__(self, host, fn, args, kwargs):
+        self.host = host
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+class ScanScheduler:
+    """
+    Central queue for scan work. A fixed pool of worker threads takes tasks
+    in priority order, never running more than per_host_limit tasks against
+    the same host or max_active tasks overall. All packets sent by the tasks
+    draw from one shared rate_limiter.
+    """
+    def __init__(self, workers=8, per_host_limit=2, max_active=None, rate=10000):
+        self.workers = workers
+        self.per_host_limit = per_host_limit
+        self.max_active = max_active or workers
+        self.rate_limiter = RateLimiter(rate)
+        self.cond = threading.Condition()
+        self.queue = []
+        self.counter = itertools.count()
+        self.host_active = {}
+        self.active = 0
+        self.threads = []
+
+    def _ensure_workers(self):
+        # Called with self.cond held.
+        if not self.threads:
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"scan-worker-{i}", daemon=True)
+                t.start()
+                self.threads.append(t)
+
+    def submit(self, host, fn, *args, priority=PRIORITY_BACKGROUND, **kwargs):
+        """
+        Queues fn(*args, **kwargs) as work against host.
+        Returns a concurrent.futures.Future with its result.
+        """
+        task = _Task(host, fn, args, kwargs)
+        with self.cond:
+            self._ensure_workers()
+            heapq.heappush(self.queue, (priority, next(self.counter), task))
+            self.cond.notify()
+        return task.future
+
+    def pending(self):
+        with self.cond:
+            return len(self.queue)
+
+    def _take(self):
+        # Called with self.cond held. Returns the best runnable task or None.
+        if self.active >= self.max_active:
+            return None
+        skipped = []
+        task = None
+        while self.queue:
+            entry = heapq.heappop(self.queue)
+            if self.host_active.get(entry[2].host, 0) < self.per_host_limit:
+                task = entry[2]
+                break
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self.queue, entry)
+        return task
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                task = self._take()
+                while task is None:
+                    self.cond.wait()
+                    task = self._take()
+                self.active += 1
+                self.host_active[task.host] = self.host_active.get(task.host, 0) + 1
+            try:
+                if task.future.set_running_or_notify_cancel():
+                    try:
+                        task.future.set_result(task.fn(*task.args, **task.kwargs))
+                    except BaseException as e:
+                        task.future.set_exception(e)
+            finally:
+                with self.cond:
+                    self.active -= 1
+                    self.host_active[task.host] -= 1
+                    if not self.host_active[task.host]:
+                        del self.host_active[task.host]
+                    self.cond.notify_all()
@@ -1,33 +1,90 @@
 # server.py
 import threading
-from flask import Flask, render_template, jsonify, request
+import csv
+import gzip
+import io
+import json
+import os
+import hmac
+import uuid
+import zlib
+from flask import Flask, Response, render_template, jsonify, request
 from flask_cors import CORS, cross_origin
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, emit
 from scanner import NetworkScanner
-from port_scanner import scan_ports_for_host, grab_banner
+from enrich import enricher
+from jobs import JobManager
+from scheduler import PRIORITY_INTERACTIVE
+from port_coverage import POPULAR_PORTS
+from port_scanner import get_engine, resolve_target
 from arp_scanner import lookup_vendor
-import time
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from models import Base, Host
-from datetime import datetime
-from db import db_session
+from datetime import datetime, timezone
+from db import db_session, save_port_results, query_ports, query_changes, iter_hosts, iter_ports
+import metrics
+from metrics import EMIT_BYTES, EMIT_SECONDS, THREADS, BANNER_LOOKUPS
+
+
+class _MeteredJSON:
+    """
+    json module for Socket.IO that records the encoded size of each event
+    packet as it is serialized, so sizes cost no extra encoding pass.
+    """
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        text = json.dumps(obj, *args, **kwargs)
+        if isinstance(obj, list) and obj and isinstance(obj[0], str):
+            EMIT_BYTES.labels(obj[0]).observe(len(text))
+        return text
+
+    loads = staticmethod(json.loads)
 
 app = Flask(__name__, static_folder='./build', template_folder='./build')
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", json=_MeteredJSON)
+THREADS.set_function(threading.active_count)
+
+@app.teardown_appcontext
+def remove_session(exception=None):
+    # Each request thread has its own session; release it when the request ends.
+    db_session.remove()
 
 # Initialize scanner without any parameters (inactive)
 scanner = NetworkScanner()
+# On-demand port scans started from the dashboard
+jobs = JobManager()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+# Part of every /api/scan ETag, so tags from an earlier server process never match.
+STORE_ID = uuid.uuid4().hex[:8]
+# (etag, JSON body) of the last /api/scan response, shared by every poller.
+scan_body = (None, None)
+
 @app.route('/api/scan')
 def api_scan():
-    data = scanner.get_data()
-    return jsonify(data)
+    global scan_body
+    snapshot = scanner.snapshot()
+    etag = f"{STORE_ID}-{snapshot.revision}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        cached_etag, body = scan_body
+        if cached_etag != etag:
+            body = json.dumps(snapshot.to_dicts())
+            scan_body = (etag, body)
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/metrics')
+def api_metrics():
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/api/scanner/start', methods=['POST'])
 def start_scanner():
@@ -37,11 +94,30 @@ def start_scanner():
     port_end = int(data.get('port_end', 1024))
     timeout = int(data.get('timeout', 2))
     interval = int(data.get('interval', 60))
+    rate = int(data.get('rate', 0)) or None
+    hosts_in_flight = int(data.get('hosts_in_flight', 0)) or None
+    incremental = bool(data.get('incremental', False))
+    ports_per_cycle = int(data.get('ports_per_cycle', 0)) or None
+    workers = int(data.get('workers', 0)) or None
+    shard_prefix = int(data.get('shard_prefix', 0)) or None
+    passive = bool(data.get('passive', False))
+    iface = data.get('iface') or None
+    engine = data.get('engine') or None
+    max_in_flight = int(data.get('max_in_flight', 0)) or None
     if not network:
         return jsonify({"error": "Network parameter is required"}), 400
-    scanner.start(network, (port_start, port_end), timeout, interval)
+    try:
+        get_engine(engine)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    scanner.start(network, (port_start, port_end), timeout, interval, rate, hosts_in_flight,
+                  incremental, ports_per_cycle, workers, shard_prefix, passive, iface, engine, max_in_flight)
     return jsonify({"status": "scanner started", "network": network})
 
+@app.route('/api/scanner/status')
+def scanner_status():
+    return jsonify(scanner.get_status())
+
 @app.route('/api/scanner/pause', methods=['POST'])
 def pause_scanner():
     scanner.pause()
@@ -57,13 +133,22 @@ def stop_scanner():
     scanner.stop()
     return jsonify({"status": "scanner stopped"})
 
-# Existing endpoints for on-demand port scan and banner grab remain unchanged.
+# On-demand port scans run as jobs; progress and results stream over Socket.IO.
 @app.route('/api/command/portscan', methods=['POST'])
 def api_port_scan():
     data = request.get_json()
     host = data.get('host')
     scan_type = data.get('scan_type', 'popular')
     timeout_val = data.get('timeout', 1)
+    engine = data.get('engine') or scanner.engine
+    if not host:
+        return jsonify({"error": "host is required"}), 400
+    try:
+        get_engine(engine)
+        # Hostnames are scanned, and stored, under their IPv4 address.
+        host = resolve_target(host)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     if scan_type == 'range':
         start_port = data.get('start_port')
@@ -75,41 +160,74 @@ def api_port_scan():
         ports = list(range(1, 65536))
     else:
         # Default/popular ports
-        ports = [21, 22, 23, 25, 53, 80, 110, 135, 139, 143, 443, 445, 993, 995, 3389, 8000, 8080, 8443, 9000, 9001, 9443]
-
-    def run_scan():
-        # Mark scanning in progress so that UI shows "Scanning in progress"
-        with scanner.lock:
-            if host in scanner.hosts:
-                scanner.hosts[host]['port_scan_in_progress'] = True
-            else:
-                # In case the host isn't already in our in-memory store
-                scanner.hosts[host] = {
-                    'mac': '',
-                    'vendor': '',
-                    'ports': [],
-                    'status': 'unknown',
-                    'last_seen': time.time(),
-                    'port_scan_in_progress': True
-                }
-        # Emit an update so the frontend sees the change
-        socketio.emit('scan_update', scanner.get_data())
-
-        # Run the port scan
-        open_ports = scan_ports_for_host(host, ports, timeout=timeout_val)
-
-        # Update in-memory data with results and mark scan as complete
-        with scanner.lock:
-            if host in scanner.hosts:
-                scanner.hosts[host]['ports'] = open_ports
-                scanner.hosts[host]['port_scan_in_progress'] = False
-        # Optionally, update the database here if desired
-
-        # Emit final results so the UI can update immediately
-        socketio.emit('port_scan_result', {'host': host, 'open_ports': open_ports})
-
-    threading.Thread(target=run_scan, daemon=True).start()
-    return jsonify({"status": "Port scan started", "host": host})
+        ports = list(POPULAR_PORTS)
+
+    # Mark scanning in progress so that UI shows "Scanning in progress"
+    # (creates a placeholder if the host isn't in our in-memory store yet)
+    scanner.update_host(host, port_scan_in_progress=True)
+
+    def finish(job):
+        # Ports outside a completed scan's range, or not reached by a
+        # cancelled one, keep their previous state.
+        scanned = job.ports if job.state == 'done' else sorted(job.open_ports)
+        scanner.merge_port_results(host, job.open_ports, scanned=scanned)
+        save_port_results({host: (scanned, sorted(job.open_ports))})
+
+    job = jobs.submit(host, ports, timeout=timeout_val, priority=PRIORITY_INTERACTIVE, on_finish=finish,
+                      engine=engine)
+    return jsonify({"status": "Port scan started", "host": host, "job_id": job.id, "engine": engine})
+
+def _job_event(event, payload):
+    # Stream newly found ports into the host store as well as to the job's watchers.
+    if payload.get('new_open_ports'):
+        scanner.merge_port_results(payload['host'], payload['new_open_ports'], in_progress=True)
+    _emit(event, payload)
+
+jobs.add_listener(_job_event)
+
+@app.route('/api/jobs')
+def api_jobs():
+    return jsonify([job.to_dict() for job in jobs.list()])
+
+@app.route('/api/jobs/<job_id>')
+def api_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def api_cancel_job(job_id):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+# Shared secret remote agents must present; ingest is open when unset.
+AGENT_TOKEN = os.environ.get('SPYNET_AGENT_TOKEN')
+
+@app.route('/api/ingest', methods=['POST'])
+def api_ingest():
+    if AGENT_TOKEN:
+        supplied = request.headers.get('Authorization', '')
+        if supplied.startswith('Bearer '):
+            supplied = supplied[len('Bearer '):]
+        # Compared as bytes: compare_digest rejects non-ASCII str.
+        if not hmac.compare_digest(supplied.encode('utf-8'), AGENT_TOKEN.encode('utf-8')):
+            return jsonify({"error": "invalid agent token"}), 401
+    body = request.get_data()
+    try:
+        if request.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        batch = json.loads(body)
+    except (OSError, ValueError):
+        return jsonify({"error": "body must be JSON, optionally gzip-compressed"}), 400
+    try:
+        scanner.ingest(batch)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"status": "ingested", "agent": batch.get('agent'),
+                    "hosts": len(batch.get('arp', [])), "port_results": len(batch.get('ports', []))})
 
 @app.route('/api/command/bannergrab', methods=['POST'])
 def api_banner_grab():
@@ -119,8 +237,149 @@ def api_banner_grab():
     timeout_val = data.get('timeout', 5)
     if not host or not port:
         return jsonify({"error": "host and port are required"}), 400
-    banner = grab_banner(host, int(port), timeout=timeout_val)
-    return jsonify({"host": host, "port": port, "banner": banner})
+    # Served from the banner cache unless it is stale or a refresh is asked for.
+    result = None if data.get('refresh') else enricher.cached(host, int(port))
+    BANNER_LOOKUPS.labels('miss' if result is None else 'hit').inc()
+    cached = result is not None
+    if result is None:
+        print(f"[+] Grabbing port {port} for host {host}")
+        try:
+            result = enricher.grab_now(host, int(port), timeout=float(timeout_val))
+        except TimeoutError as e:
+            return jsonify({"error": str(e)}), 504
+    result['cached'] = cached
+    result['host'] = host
+    # 'banner' stays a display string for older clients.
+    result['banner'] = result['banner'] or result['error'] or "No banner received."
+    return jsonify(result)
+
+def _pagination():
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = min(1000, max(1, request.args.get('per_page', 100, type=int)))
+    return page, per_page
+
+def _parse_since(value):
+    # Accepts epoch seconds or an ISO 8601 timestamp; returns a naive UTC datetime.
+    # Raises ValueError, OverflowError or OSError for values that are neither.
+    try:
+        seconds = float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    return datetime.utcfromtimestamp(seconds)
+
+@app.route('/api/ports')
+def api_ports():
+    page, per_page = _pagination()
+    state = request.args.get('state', 'open')
+    items, has_more = query_ports(port=request.args.get('port', type=int),
+                                  ip=request.args.get('ip'),
+                                  state=None if state == 'any' else state,
+                                  protocol=request.args.get('protocol', 'tcp'),
+                                  page=page, per_page=per_page)
+    return jsonify({"page": page, "per_page": per_page, "has_more": has_more, "items": items})
+
+@app.route('/api/changes')
+def api_changes():
+    since = request.args.get('since')
+    if not since:
+        return jsonify({"error": "since parameter is required"}), 400
+    try:
+        since = _parse_since(since)
+    except (ValueError, OverflowError, OSError):
+        return jsonify({"error": "since must be epoch seconds or an ISO 8601 timestamp"}), 400
+    page, per_page = _pagination()
+    items, has_more = query_changes(since, port=request.args.get('port', type=int),
+                                    ip=request.args.get('ip'), page=page, per_page=per_page)
+    return jsonify({"page": page, "per_page": per_page, "has_more": has_more, "items": items})
+
+# Streamed exports are flushed to the client in pieces of about this many bytes.
+EXPORT_CHUNK = 64 * 1024
+HOST_COLUMNS = ['ip', 'mac', 'vendor', 'hostname', 'is_dhcp', 'status', 'last_seen', 'open_ports']
+PORT_COLUMNS = ['ip', 'port', 'protocol', 'state', 'first_seen', 'last_seen', 'vendor', 'status']
+
+def _export_records(kind, status, vendor, port):
+    # Status only lives in memory, so it comes from the current snapshot.
+    hosts = scanner.snapshot().hosts
+    if kind == 'hosts':
+        for row, open_ports in iter_hosts(vendor=vendor, port=port):
+            record = hosts.get(row.ip)
+            host_status = record.status if record is not None else 'offline'
+            if status and host_status != status:
+                continue
+            yield {'ip': row.ip, 'mac': row.mac, 'vendor': row.vendor, 'hostname': row.hostname,
+                   'is_dhcp': row.is_dhcp, 'status': host_status, 'last_seen': row.last_seen.isoformat() + 'Z',
+                   'open_ports': open_ports}
+    else:
+        for row in iter_ports(port=port, vendor=vendor):
+            record = hosts.get(row.ip)
+            host_status = record.status if record is not None else 'offline'
+            if status and host_status != status:
+                continue
+            yield {'ip': row.ip, 'port': row.port, 'protocol': row.protocol, 'state': row.state,
+                   'first_seen': row.first_seen.isoformat() + 'Z', 'last_seen': row.last_seen.isoformat() + 'Z',
+                   'vendor': row.vendor, 'status': host_status}
+
+def _export_lines(records, fmt, columns):
+    if fmt == 'ndjson':
+        for record in records:
+            yield json.dumps(record) + '\n'
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for record in records:
+        if 'open_ports' in record:
+            record['open_ports'] = ' '.join(map(str, record['open_ports']))
+        writer.writerow([record[c] for c in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def _export_chunks(lines, compress):
+    # Joins lines into EXPORT_CHUNK sized pieces, gzip-compressing them as a stream.
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    pending, size = [], 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK:
+            data = ''.join(pending).encode('utf-8')
+            pending, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = ''.join(pending).encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+# Bulk export of every stored host (kind=hosts) or port (kind=ports) as NDJSON or CSV,
+# optionally gzip-compressed and filtered by status, vendor and port.
+@app.route('/api/export')
+def api_export():
+    kind = request.args.get('kind', 'hosts')
+    fmt = request.args.get('format', 'ndjson')
+    status = request.args.get('status')
+    if kind not in ('hosts', 'ports'):
+        return jsonify({"error": "kind must be hosts or ports"}), 400
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+    if status not in (None, 'online', 'offline'):
+        return jsonify({"error": "status must be online or offline"}), 400
+    compress = (request.args.get('gzip', '').lower() in ('1', 'true')
+                or 'gzip' in request.accept_encodings)
+    records = _export_records(kind, status, request.args.get('vendor'), request.args.get('port', type=int))
+    lines = _export_lines(records, fmt, HOST_COLUMNS if kind == 'hosts' else PORT_COLUMNS)
+    headers = {'Content-Disposition': f'attachment; filename=spynet-{kind}.{fmt}', 'Vary': 'Accept-Encoding'}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+    return Response(_export_chunks(lines, compress), mimetype=mimetype, headers=headers)
 
 @app.route('/api/host/update', methods=['POST'])
 def update_host():
@@ -146,10 +405,12 @@ def update_host():
 
     # Also update the in-memory data, if available.
     if ip in scanner.hosts:
+        fields = {}
         if hostname is not None:
-            scanner.hosts[ip]['hostname'] = hostname
+            fields['hostname'] = hostname
         if is_dhcp is not None:
-            scanner.hosts[ip]['is_dhcp'] = bool(is_dhcp)
+            fields['is_dhcp'] = bool(is_dhcp)
+        scanner.update_host(ip, **fields)
 
     return jsonify({"status": "Host updated", "ip": ip, "hostname": db_host.hostname, "is_dhcp": db_host.is_dhcp})
 
@@ -162,7 +423,7 @@ def api_maclookup():
         return jsonify({"error": "host is required"}), 400
 
     # Try to get the host data from memory; if not, fall back to the database.
-    host_data = scanner.hosts.get(host_ip)
+    host_data = scanner.get_host(host_ip)
     if host_data:
         mac = host_data.get('mac')
     else:
@@ -172,13 +433,12 @@ def api_maclookup():
         else:
             return jsonify({"error": "Host not found"}), 404
 
-    # Import and call the lookup_vendor function from arp_scanner.
-    from arp_scanner import lookup_vendor
-    vendor = lookup_vendor(mac)
+    # Explicit lookups may fall back to the remote API synchronously.
+    vendor = lookup_vendor(mac, remote=True)
 
     # Save vendor to in-memory data if available.
     if host_data:
-        host_data['vendor'] = vendor
+        scanner.update_host(host_ip, vendor=vendor)
 
     # Update the database record with the found vendor.
     db_host = db_session.query(Host).filter_by(ip=host_ip).first()
@@ -190,11 +450,43 @@ def api_maclookup():
 
 
 
+def _emit(event, payload, send=None):
+    # send is flask_socketio.emit to reply to the current client; the default
+    # broadcasts to everyone.
+    with EMIT_SECONDS.labels(event).time():
+        (send or socketio.emit)(event, payload)
+
+@socketio.on('connect')
+def handle_connect():
+    # New clients start from a full snapshot and then follow the deltas.
+    revision, hosts = scanner.get_snapshot()
+    _emit('scan_snapshot', {'revision': revision, 'hosts': hosts}, emit)
+
+@socketio.on('resync')
+def handle_resync(data):
+    # A client missed a delta: catch it up from its revision, or resend everything.
+    revision = (data or {}).get('revision', -1)
+    delta = scanner.changes_since(revision) if isinstance(revision, int) else None
+    if delta is None:
+        revision, hosts = scanner.get_snapshot()
+        _emit('scan_snapshot', {'revision': revision, 'hosts': hosts}, emit)
+    else:
+        _emit('scan_delta', {'from': revision, 'to': delta[0], 'patches': delta[1]}, emit)
+
 def background_thread():
+    sent = scanner.revision
     while True:
         socketio.sleep(1)
-        data = scanner.get_data()
-        socketio.emit('scan_update', data)
+        if scanner.revision == sent:
+            continue
+        delta = scanner.changes_since(sent)
+        if delta is None:
+            revision, hosts = scanner.get_snapshot()
+            _emit('scan_snapshot', {'revision': revision, 'hosts': hosts})
+            sent = revision
+        else:
+            _emit('scan_delta', {'from': sent, 'to': delta[0], 'patches': delta[1]})
+            sent = delta[0]
 
 if __name__ == '__main__':
     socketio.start_background_task(target=background_thread)
@@ -0,0 +1,60 @@
+# shard_worker.py
+import ipaddress
+from arp_scanner import arp_scan
+from port_scanner import iter_host_scans, set_scan_rate
+from scheduler import PRIORITY_BACKGROUND
+from port_coverage import PortCoverage
+from db import session_scope, load_open_ports
+
+def shard_networks(networks, prefix=24):
+    """
+    Splits each CIDR larger than /prefix into /prefix subnets.
+    Returns a list of CIDR strings.
+    """
+    shards = []
+    for network in networks:
+        net = ipaddress.ip_network(network, strict=False)
+        if net.prefixlen < prefix:
+            shards.extend(str(subnet) for subnet in net.subnets(new_prefix=prefix))
+        else:
+            shards.append(str(net))
+    return shards
+
+def scan_shard(network, port_range, timeout, rate, hosts_in_flight, incremental, window, recent_window, results,
+               engine=None):
+    """
+    Runs in a worker process: ARP scans one shard and port scans its live
+    hosts, putting messages on the results queue as work completes:
+      ('arp', network, live_hosts)
+      ('scanning', ip)
+      ('ports', ip, scanned_ports, open_ports)
+      ('done', network, error or None)   -- always sent last
+    """
+    error = None
+    try:
+        set_scan_rate(rate)
+        live_hosts = arp_scan(network, timeout=timeout)
+        results.put(('arp', network, live_hosts))
+        ips = [host['ip'] for host in live_hosts]
+        if incremental:
+            # Coverage state lives in the database, so any worker can pick up a shard.
+            coverage = PortCoverage(window)
+            with session_scope() as session:
+                known_open = load_open_ports(session, ips, state="open")
+            plans = coverage.plan(ips, port_range, known_open, recent_window)
+        else:
+            ports = list(range(port_range[0], port_range[1] + 1))
+            plans = {ip: ports for ip in ips}
+        completed = []
+        for ip, open_ports, complete in iter_host_scans(
+                plans, timeout=timeout, priority=PRIORITY_BACKGROUND, in_flight=hosts_in_flight,
+                on_start=lambda ip: results.put(('scanning', ip)), engine=engine):
+            results.put(('ports', ip, plans[ip] if complete else open_ports, open_ports))
+            if complete:
+                completed.append(ip)
+        if incremental:
+            coverage.advance(completed)
+    except Exception as e:
+        error = str(e)
+    finally:
+        results.put(('done', network, error))
@@ -9,6 +9,8 @@ const ENDPOINT = 'http://192.168.1.81:5000';
 
 function App() {
   const [scanData, setScanData] = useState({});
+  // Latest state of each host's on-demand port scan job, keyed by IP.
+  const [scanJobs, setScanJobs] = useState({});
   const [selectedHost, setSelectedHost] = useState(null);
   const [bannerPort, setBannerPort] = useState('');
   const [bannerResult, setBannerResult] = useState(null);
@@ -25,10 +27,42 @@ function App() {
 
   useEffect(() => {
     const socket = socketIOClient(ENDPOINT);
-    socket.on('scan_update', (data) => {
-      console.log('Received scan_update:', data);
-      setScanData(data);
+    // Revision of the host data we hold; deltas only apply on top of it.
+    let revision = null;
+    socket.on('scan_snapshot', (data) => {
+      revision = data.revision;
+      setScanData(data.hosts);
     });
+    socket.on('scan_delta', (delta) => {
+      if (revision === null || delta.from > revision) {
+        // We missed an update; ask the server to catch us up.
+        socket.emit('resync', { revision });
+        return;
+      }
+      if (delta.to <= revision) {
+        // Already covered by a newer snapshot or delta.
+        return;
+      }
+      // Patches carry whole host records as of delta.to, so a delta that
+      // starts before our revision can be applied over it.
+      revision = delta.to;
+      setScanData((prev) => {
+        const next = { ...prev };
+        delta.patches.forEach(({ op, ip, host }) => {
+          if (op === 'removed') {
+            delete next[ip];
+          } else {
+            next[ip] = host;
+          }
+        });
+        return next;
+      });
+    });
+    const updateJob = (job) => {
+      setScanJobs((prev) => ({ ...prev, [job.host]: job }));
+    };
+    socket.on('port_scan_progress', updateJob);
+    socket.on('port_scan_result', updateJob);
     return () => socket.disconnect();
   }, []);
 
@@ -79,6 +113,15 @@ function App() {
       .catch((err) => console.error('Error starting port scan:', err));
   };
 
+  const cancelPortScan = () => {
+    const job = scanJobs[selectedHost];
+    if (!job) return;
+    fetch(`${ENDPOINT}/api/jobs/${job.job_id}/cancel`, { method: 'POST' })
+      .then((response) => response.json())
+      .then((data) => console.log('Port scan cancelled:', data))
+      .catch((err) => console.error('Error cancelling port scan:', err));
+  };
+
   const startBannerGrab = () => {
     if (!selectedHost || !bannerPort) return;
     const payload = {
@@ -164,7 +207,10 @@ function App() {
             Open Ports: {host.ports && host.ports.length ? host.ports.join(', ') : "None"}
           </p>
           {host.port_scan_in_progress && (
-            <p className="scanning-indicator">Scanning in progress...</p>
+            <p className="scanning-indicator">
+              Scanning in progress...
+              {scanJobs[ip] && scanJobs[ip].state === 'running' ? ` ${scanJobs[ip].progress}%` : ''}
+            </p>
           )}
           <p className="dhcp-flag">
             Type: {host.is_dhcp ? "DHCP" : "Static"}
@@ -205,6 +251,8 @@ function App() {
               rangeEnd={rangeEnd}
               onRangeEndChange={(e) => setRangeEnd(e.target.value)}
               startPortScan={startPortScan}
+              scanJob={scanJobs[selectedHost]}
+              cancelPortScan={cancelPortScan}
               bannerPort={bannerPort}
               onBannerPortChange={(e) => setBannerPort(e.target.value)}
               startBannerGrab={startBannerGrab}
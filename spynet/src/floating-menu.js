@@ -17,6 +17,8 @@ const FloatingMenu = ({
   rangeEnd,
   onRangeEndChange,
   startPortScan,
+  scanJob,
+  cancelPortScan,
   bannerPort,
   onBannerPortChange,
   startBannerGrab,
@@ -91,6 +93,14 @@ const FloatingMenu = ({
         <button className="btn btn-action" onClick={startPortScan}>
           Start Port Scan
         </button>
+        {scanJob && (scanJob.state === 'queued' || scanJob.state === 'running') && (
+          <div className="scan-progress">
+            <p>{scanJob.state === 'queued' ? 'Queued' : `Scanning: ${scanJob.progress}%`}</p>
+            <button className="btn btn-action" onClick={cancelPortScan}>
+              Cancel Scan
+            </button>
+          </div>
+        )}
       </div>
       
       {/* Group 3: Banner Grabbing */}
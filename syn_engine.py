@@ -0,0 +1,297 @@
+# syn_engine.py
+import hashlib
+import os
+import socket
+import struct
+import threading
+import time
+from congestion import RateLimiter, host_conditions
+from metrics import SYN_PROBES_SENT, SYN_REPLIES_OPEN, SYN_REPLIES_CLOSED
+
+# Source ports used for probes. Each running scan owns one of them, which is
+# how the shared receiver knows which scan a reply belongs to.
+SPORT_BASE = 40000
+SPORT_COUNT = 20000
+# Probes to one port per scan; the attempt number is added to the cookie.
+MAX_ATTEMPTS = 8
+
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+
+def _checksum(data):
+    """
+    Internet checksum (RFC 1071) over the given bytes.
+    """
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def build_tcp_segment(src, dst, sport, dport, seq, flags, ack=0):
+    """
+    Builds a bare 20 byte TCP header (no options) with a valid checksum.
+    src and dst are dotted-quad strings; the kernel adds the IP header.
+    """
+    header = struct.pack("!HHIIBBHHH", sport, dport, seq, ack, 5 << 4, flags, 1024, 0, 0)
+    pseudo = socket.inet_aton(src) + socket.inet_aton(dst) + struct.pack("!BBH", 0, socket.IPPROTO_TCP, len(header))
+    csum = _checksum(pseudo + header)
+    return header[:16] + struct.pack("!H", csum) + header[18:]
+
+
+def parse_tcp_reply(data):
+    """
+    Parses an IPv4 packet carrying TCP.
+    Returns (src_ip, sport, dport, seq, ack, flags) or None if it is not TCP.
+    """
+    if len(data) < 20 or data[0] >> 4 != 4 or data[9] != socket.IPPROTO_TCP:
+        return None
+    ihl = (data[0] & 0x0F) * 4
+    if len(data) < ihl + 14:
+        return None
+    sport, dport, seq, ack, _, flags = struct.unpack("!HHIIBB", data[ihl:ihl + 14])
+    return socket.inet_ntoa(data[12:16]), sport, dport, seq, ack, flags
+
+
+class RawSocketTransport:
+    """
+    Sends TCP segments through one raw socket and reads every incoming
+    TCP packet from a second one. Requires root (CAP_NET_RAW).
+    """
+    def __init__(self, poll_interval=0.2):
+        self.send_sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+        self.recv_sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+        self.recv_sock.settimeout(poll_interval)
+        self.source_cache = {}
+
+    def source_for(self, dst):
+        """
+        Returns the local address the kernel would use to reach dst.
+        """
+        src = self.source_cache.get(dst)
+        if src is None:
+            probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                probe.connect((dst, 9))
+                src = probe.getsockname()[0]
+            finally:
+                probe.close()
+            self.source_cache[dst] = src
+        return src
+
+    def send(self, dst, segment):
+        self.send_sock.sendto(segment, (dst, 0))
+
+    def recv(self):
+        """
+        Returns one raw IPv4 packet, or None if nothing arrived in time.
+        """
+        try:
+            return self.recv_sock.recv(65535)
+        except socket.timeout:
+            return None
+
+    def close(self):
+        self.send_sock.close()
+        self.recv_sock.close()
+
+
+class _Scan:
+    """
+    Bookkeeping for one call to SynScanEngine.scan().
+    """
+    def __init__(self, sport, targets, on_open=None):
+        self.sport = sport
+        self.on_open = on_open  # callable(ip, port) run by the receiver on each new open port
+        self.lock = threading.Lock()
+        self.pending = {(ip, port) for ip, ports in targets.items() for port in ports}
+        self.open_ports = {ip: set() for ip in targets}
+        self.sent = {}  # (ip, port) -> send time of each attempt
+        self.answered_hosts = set()  # hosts that replied during the current round
+        self.lossy_hosts = set()  # hosts whose earlier attempt at a probe went unanswered
+        self.round_started = 0  # time.monotonic() when the current round's probes were sent
+        self.last_answer = 0  # time.monotonic() of the latest reply
+        self.done = threading.Event()
+        if not self.pending:
+            self.done.set()
+
+    def answer(self, ip, port, is_open, attempt):
+        """
+        Records a reply to the given attempt (1 for the first probe). Returns
+        the RTT sample it yields, or False if the probe was already answered
+        or the attempt was never sent.
+        """
+        now = time.monotonic()
+        with self.lock:
+            sent = self.sent.get((ip, port), ())
+            if (ip, port) not in self.pending or attempt > len(sent):
+                return False
+            self.pending.discard((ip, port))
+            if is_open:
+                self.open_ports[ip].add(port)
+            if not self.pending:
+                self.done.set()
+            self.answered_hosts.add(ip)
+            self.last_answer = now
+            # Replies name the attempt they answer, so a late reply to the
+            # first probe is not mistaken for a retransmission that got
+            # through; only a reply to a later attempt shows a loss.
+            if attempt > 1:
+                self.lossy_hosts.add(ip)
+            return now - sent[attempt - 1]
+
+
+class SynScanEngine:
+    """
+    SYN scanner shared by all scans: one sender and one receiver thread.
+    Probes carry a keyed cookie plus the attempt number in their sequence
+    number, so replies are validated without looking up the probe and name
+    the attempt they answer; only unanswered probes are sent again on the
+    next round. Reply times feed the per-host RTT
+    estimates that set how long each round waits, and hosts that drop
+    replies get their send rate cut.
+    """
+    def __init__(self, rate=10000, retries=2, transport=None, rate_limiter=None, conditions=None):
+        self.rate_limiter = rate_limiter or RateLimiter(rate)
+        self.retries = retries
+        self.transport = transport
+        self.conditions = conditions or host_conditions
+        self.secret = os.urandom(16)
+        self.scans = {}
+        self.lock = threading.Lock()
+        self.receiver = None
+        self.next_sport = 0
+
+    def set_rate(self, rate):
+        self.rate_limiter.set_rate(rate)
+
+    def cookie(self, ip, port, sport):
+        digest = hashlib.blake2s(socket.inet_aton(ip) + struct.pack("!HH", port, sport),
+                                 digest_size=4, key=self.secret).digest()
+        return struct.unpack("!I", digest)[0]
+
+    def _ensure_running(self):
+        with self.lock:
+            if self.transport is None:
+                self.transport = RawSocketTransport()
+            if self.receiver is None or not self.receiver.is_alive():
+                self.receiver = threading.Thread(target=self._receive_loop, daemon=True)
+                self.receiver.start()
+
+    def _allocate_sport(self, scan_targets, on_open=None):
+        with self.lock:
+            for _ in range(SPORT_COUNT):
+                sport = SPORT_BASE + self.next_sport
+                self.next_sport = (self.next_sport + 1) % SPORT_COUNT
+                if sport not in self.scans:
+                    scan = _Scan(sport, scan_targets, on_open)
+                    self.scans[sport] = scan
+                    return scan
+        raise RuntimeError("No free source port for a new SYN scan")
+
+    def _receive_loop(self):
+        while True:
+            data = self.transport.recv()
+            if data is None:
+                continue
+            parsed = parse_tcp_reply(data)
+            if parsed is None:
+                continue
+            src, sport, dport, seq, ack, flags = parsed
+            scan = self.scans.get(dport)
+            if scan is None or not flags & TCP_ACK:
+                continue
+            attempt = ((ack - 1 - self.cookie(src, sport, dport)) & 0xFFFFFFFF) + 1
+            if attempt > MAX_ATTEMPTS:
+                continue
+            if flags & TCP_SYN and not flags & TCP_RST:
+                rtt = scan.answer(src, sport, True, attempt)
+                if rtt is not False:
+                    SYN_REPLIES_OPEN.inc()
+                    if scan.on_open is not None:
+                        scan.on_open(src, sport)
+                    # Tear down the half-open connection.
+                    self._send(src, dport, sport, ack, TCP_RST)
+            elif flags & TCP_RST:
+                rtt = scan.answer(src, sport, False, attempt)
+                if rtt is not False:
+                    SYN_REPLIES_CLOSED.inc()
+            else:
+                continue
+            if rtt:
+                self.conditions.record_rtt(src, rtt)
+
+    def _send(self, dst, sport, dport, seq, flags):
+        src = self.transport.source_for(dst)
+        self.transport.send(dst, build_tcp_segment(src, dst, sport, dport, seq, flags))
+
+    def _wait(self, scan, timeout, cancel):
+        # Waits for the round to be answered, waking early if cancelled. The
+        # round ends once timeout passes without a reply, so replies still
+        # queued for the receiver thread are not given up on and resent.
+        while cancel is None or not cancel.is_set():
+            deadline = max(scan.last_answer, scan.round_started) + timeout
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or scan.done.wait(min(0.1, remaining)):
+                return
+
+    def scan(self, targets, timeout=1, retries=None, cancel=None, on_open=None):
+        """
+        Scans targets, a mapping of ip -> iterable of ports. timeout is the
+        longest a round waits for replies; hosts with a measured RTT get a
+        shorter wait. Setting the cancel Event stops sending and returns the
+        ports found so far. on_open(ip, port) is called from the receiver
+        thread as each open port is found and must not block.
+        Returns a mapping of ip -> sorted list of open ports.
+        """
+        targets = {ip: list(ports) for ip, ports in targets.items()}
+        self._ensure_running()
+        scan = self._allocate_sport(targets, on_open)
+        retries = min(self.retries if retries is None else retries, MAX_ATTEMPTS - 1)
+        try:
+            for _ in range(retries + 1):
+                with scan.lock:
+                    unanswered = sorted(scan.pending)
+                    scan.answered_hosts.clear()
+                    scan.lossy_hosts.clear()
+                if not unanswered or (cancel is not None and cancel.is_set()):
+                    break
+                sent = 0
+                for ip, port in unanswered:
+                    if cancel is not None and cancel.is_set():
+                        break
+                    self.rate_limiter.acquire()
+                    host_limiter = self.conditions.limiter_for(ip)
+                    if host_limiter is not None:
+                        host_limiter.acquire()
+                    with scan.lock:
+                        sent_at = scan.sent.setdefault((ip, port), [])
+                        sent_at.append(time.monotonic())
+                        attempt = len(sent_at)
+                    seq = (self.cookie(ip, port, scan.sport) + attempt - 1) & 0xFFFFFFFF
+                    self._send(ip, scan.sport, port, seq, TCP_SYN)
+                    sent += 1
+                SYN_PROBES_SENT.inc(sent)
+                if cancel is not None and cancel.is_set():
+                    break
+                hosts = {ip for ip, _ in unanswered}
+                scan.round_started = time.monotonic()
+                self._wait(scan, max(self.conditions.timeout_for(ip, timeout) for ip in hosts), cancel)
+                if cancel is not None and cancel.is_set():
+                    # A partial round says nothing about loss.
+                    break
+                with scan.lock:
+                    answered, lossy = set(scan.answered_hosts), set(scan.lossy_hosts)
+                for ip in hosts:
+                    if ip in lossy:
+                        self.conditions.on_loss(ip, self.rate_limiter.rate)
+                    elif ip in answered:
+                        self.conditions.on_clean(ip, self.rate_limiter.rate)
+        finally:
+            with self.lock:
+                self.scans.pop(scan.sport, None)
+        return {ip: sorted(ports) for ip, ports in scan.open_ports.items()}
@@ -0,0 +1,10 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+# Point the modules under test at a throwaway database before db.py is
+# imported, and keep vendor lookups off the network.
+os.environ['SPYNET_DB_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='spynet-test-'), 'test.db')}"
+os.environ['SPYNET_VENDOR_API'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
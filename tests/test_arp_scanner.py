@@ -0,0 +1,43 @@
+# tests/test_arp_scanner.py
+import queue
+import time
+import arp_scanner
+
+
+class FakeArpTransport:
+    """
+    Answers ARP requests for the hosts in live. The first request to each
+    address in drop_first goes unanswered.
+    """
+    def __init__(self, live, drop_first=()):
+        self.live = live  # ip -> mac
+        self.drop_first = set(drop_first)
+        self.requests = []
+        self.replies = queue.Queue()
+
+    def send(self, ip):
+        self.requests.append(ip)
+        if ip in self.drop_first:
+            self.drop_first.discard(ip)
+        elif ip in self.live:
+            self.replies.put((ip, self.live[ip], time.time()))
+
+    def recv(self, timeout):
+        try:
+            return self.replies.get(timeout=timeout) if timeout else self.replies.get_nowait()
+        except queue.Empty:
+            return None
+
+    def close(self):
+        pass
+
+
+def test_first_sweep_asks_silent_hosts_again(monkeypatch):
+    live = {"10.204.0.1": "02:00:00:00:04:01", "10.204.0.2": "02:00:00:00:04:02"}
+    transport = FakeArpTransport(live, drop_first=["10.204.0.2"])
+    monkeypatch.setattr(arp_scanner, 'open_arp_transport', lambda network: transport)
+    found = arp_scanner.arp_scan("10.204.0.0/29", timeout=0.1)
+    assert sorted((h['ip'], h['mac']) for h in found) == sorted(live.items())
+    # Only the hosts that stayed silent were asked twice.
+    assert len(transport.requests) == 6 + 5
+    assert transport.requests.count("10.204.0.1") == 1
@@ -0,0 +1,75 @@
+# tests/test_changes.py
+import time
+from collections import deque
+import pytest
+from db import save_port_results
+from scanner import NetworkScanner
+
+
+@pytest.fixture(scope='module')
+def client():
+    import server
+    return server.app.test_client()
+
+
+@pytest.mark.parametrize('since', ['1e20', '-1e20', 'nan', 'inf', 'yesterday', '2024-13-01'])
+def test_changes_rejects_bad_since(client, since):
+    response = client.get('/api/changes', query_string={'since': since})
+    assert response.status_code == 400
+
+
+def test_changes_requires_since(client):
+    assert client.get('/api/changes').status_code == 400
+
+
+@pytest.mark.parametrize('since', [lambda t: str(t), lambda t: time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(t)),
+                                   lambda t: time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(t))])
+def test_changes_since_epoch_or_iso(client, since):
+    ip = "10.201.0.1"
+    before = int(time.time()) - 1
+    save_port_results({ip: ([8080], [8080])})
+    response = client.get('/api/changes', query_string={'since': since(before), 'ip': ip})
+    assert response.status_code == 200
+    assert [(i['ip'], i['port'], i['state']) for i in response.get_json()['items']][:1] == [(ip, 8080, 'open')]
+    later = client.get('/api/changes', query_string={'since': since(time.time() + 60), 'ip': ip})
+    assert later.get_json()['items'] == []
+
+
+def make_scanner():
+    scanner = NetworkScanner()
+    assert scanner.loaded.wait(10)
+    return scanner
+
+
+def test_changes_since_revision():
+    scanner = make_scanner()
+    start = scanner.revision
+    scanner.update_host("10.201.1.1")
+    scanner.update_host("10.201.1.2")
+    middle = scanner.revision
+    scanner.update_host("10.201.1.1", hostname="nas")
+
+    revision, patches = scanner.changes_since(start)
+    assert revision == scanner.revision
+    # One patch per host, carrying the latest record; a host added in the window stays 'added'.
+    by_ip = {p['ip']: p for p in patches}
+    assert set(by_ip) == {"10.201.1.1", "10.201.1.2"}
+    assert by_ip["10.201.1.1"]['op'] == 'added'
+    assert by_ip["10.201.1.1"]['host']['hostname'] == "nas"
+
+    revision, patches = scanner.changes_since(middle)
+    assert [(p['ip'], p['op']) for p in patches] == [("10.201.1.1", 'changed')]
+    assert scanner.changes_since(scanner.revision) == (scanner.revision, [])
+
+
+def test_changes_since_outside_the_log():
+    scanner = make_scanner()
+    scanner.changes = deque(maxlen=2)
+    start = scanner.revision
+    for i in range(4):
+        scanner.update_host(f"10.201.2.{i}")
+    # Too old for the change log, or not reached yet: a snapshot is needed.
+    assert scanner.changes_since(start) is None
+    assert scanner.changes_since(scanner.revision + 1) is None
+    revision, patches = scanner.changes_since(scanner.revision - 2)
+    assert {p['ip'] for p in patches} == {"10.201.2.2", "10.201.2.3"}
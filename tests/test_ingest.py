@@ -0,0 +1,85 @@
+# tests/test_ingest.py
+import gzip
+import json
+import pytest
+
+HOST = {'ip': "10.203.0.5", 'mac': "02:00:00:00:03:05", 'vendor': "Acme"}
+
+
+@pytest.fixture(scope='module')
+def server():
+    import server
+    return server
+
+
+def post(server, batch, gzipped=False):
+    body = json.dumps(batch).encode('utf-8')
+    headers = {'Content-Type': 'application/json'}
+    if gzipped:
+        body = gzip.compress(body)
+        headers['Content-Encoding'] = 'gzip'
+    return server.app.test_client().post('/api/ingest', data=body, headers=headers)
+
+
+@pytest.mark.parametrize('batch', [
+    [1, 2],
+    "batch",
+    {'arp': {}},
+    {'arp': [1]},
+    {'arp': [{'ip': "10.203.0.1", 'mac': "02:00:00:00:03:01"}]},
+    {'arp': [{'ip': "not an ip", 'mac': "02:00:00:00:03:01", 'vendor': "x"}]},
+    {'arp': [{'ip': 167772161, 'mac': "02:00:00:00:03:01", 'vendor': "x"}]},
+    {'arp': [{'ip': "::1", 'mac': "02:00:00:00:03:01", 'vendor': "x"}]},
+    {'arp': [dict(HOST, mac=5)]},
+    {'arp': [dict(HOST, mac=["02:00:00:00:03:05"])]},
+    {'arp': [dict(HOST, vendor={'name': "Acme"})]},
+    {'networks': [{'live': []}]},
+    {'networks': [{'network': "10.203.0.0/99"}]},
+    {'networks': [{'network': 24}]},
+    {'networks': [{'network': "10.203.0.0/24", 'live': "10.203.0.5"}]},
+    {'networks': [{'network': "10.203.0.0/24", 'live': [{}]}]},
+    {'networks': [{'network': "10.203.0.0/24", 'live': ["10.203.0.500"]}]},
+    {'ports': [{'open': [22]}]},
+    {'ports': [{'ip': "10.203.0.5", 'open': ["22"]}]},
+    {'ports': [{'ip': "10.203.0.5", 'open': [70000]}]},
+    {'ports': [{'ip': "10.203.0.5", 'scanned': [[1, None]]}]},
+    {'ports': [{'ip': "10.203.0.5", 'scanned': [[100, 1]]}]},
+    {'ports': [{'ip': "10.203.0.5", 'scanned': [[1, 2, 3]]}]},
+])
+def test_malformed_batches_are_rejected(server, batch):
+    revision = server.scanner.revision
+    response = post(server, batch)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+    # Nothing was merged.
+    assert server.scanner.revision == revision
+
+
+def test_rejects_a_body_that_is_not_json(server):
+    response = server.app.test_client().post('/api/ingest', data=b"\x00not json")
+    assert response.status_code == 400
+
+
+def test_valid_batch_is_merged(server):
+    batch = {'agent': "lab-1", 'arp': [HOST],
+             'ports': [{'ip': HOST['ip'], 'scanned': [[1, 1024]], 'open': [22, 80]}],
+             'networks': [{'network': "10.203.0.0/24", 'live': [HOST['ip']]}]}
+    response = post(server, batch, gzipped=True)
+    assert response.status_code == 200
+    assert response.get_json() == {'status': "ingested", 'agent': "lab-1", 'hosts': 1, 'port_results': 1}
+    host = server.scanner.get_host(HOST['ip'])
+    assert host['mac'] == HOST['mac'] and host['ports'] == [22, 80]
+
+
+@pytest.mark.parametrize('authorization, status', [
+    ("Bearer s3cret", 200),
+    ("s3cret", 200),
+    ("Bearer wrong", 401),
+    ("Bearer s3crét", 401),
+    ("", 401),
+])
+def test_agent_token(server, monkeypatch, authorization, status):
+    monkeypatch.setattr(server, 'AGENT_TOKEN', "s3cret")
+    headers = {'Authorization': authorization.encode('utf-8').decode('latin-1')} if authorization else {}
+    response = server.app.test_client().post('/api/ingest', data=json.dumps({'agent': "lab-1"}), headers=headers)
+    assert response.status_code == status
@@ -0,0 +1,39 @@
+# tests/test_oui.py
+import os
+from oui import OuiDatabase, build_index, mac_to_int, INDEX_FILE
+
+REGISTRY = "Registry,Assignment,Organization Name,Organization Address\n"
+
+
+def write_csv(path, rows):
+    with open(path, 'w') as f:
+        f.write(REGISTRY)
+        for assignment, name in rows:
+            f.write(f'MA,{assignment},"{name}",Somewhere\n')
+
+
+def test_mac_to_int():
+    assert mac_to_int("00:1A:2b-3c.4d 5e") == 0x001A2B3C4D5E
+    assert mac_to_int("00:1a:2b") is None
+    assert mac_to_int("zz:1a:2b:3c:4d:5e") is None
+
+
+def test_longest_prefix_lookup(tmp_path):
+    write_csv(tmp_path / 'oui.csv', [("001A2B", "Large Corp"), ("F0F0F0", "Other Inc")])
+    write_csv(tmp_path / 'mam.csv', [("001A2B3", "Medium Ltd")])
+    write_csv(tmp_path / 'oui36.csv', [("001A2B3C4", "Small GmbH")])
+    db = OuiDatabase(str(tmp_path))
+    assert db.lookup("00:1a:2b:3c:4d:5e") == "Small GmbH"
+    assert db.lookup("00:1a:2b:3d:00:00") == "Medium Ltd"
+    assert db.lookup("00:1a:2b:00:00:01") == "Large Corp"
+    assert db.lookup("f0:f0:f0:00:00:00") == "Other Inc"
+    assert db.lookup("02:00:00:00:00:01") is None
+    assert db.lookup("not a mac") is None
+
+
+def test_build_leaves_no_temp_files(tmp_path):
+    write_csv(tmp_path / 'oui.csv', [("001A2B", "Large Corp")])
+    out = tmp_path / INDEX_FILE
+    assert build_index([str(tmp_path / 'oui.csv')], str(out)) == 1
+    assert build_index([str(tmp_path / 'oui.csv')], str(out)) == 1
+    assert sorted(os.listdir(tmp_path)) == ['oui.csv', INDEX_FILE]
@@ -0,0 +1,39 @@
+# tests/test_passive.py
+from scapy.layers.l2 import ARP, Ether
+from passive import PassiveListener
+
+LOCAL_IP, LOCAL_MAC = "10.205.0.254", "02:00:00:00:05:fe"
+
+
+class FakeScanner:
+    def __init__(self):
+        self.observed = []
+        self.queued = []
+
+    def in_scope(self, ip):
+        return True
+
+    def observe_host(self, ip, mac, is_dhcp):
+        self.observed.append((ip, mac))
+        return 'new'
+
+    def queue_port_scan(self, ip):
+        self.queued.append(ip)
+
+
+def arp(psrc, hwsrc):
+    return Ether(src=hwsrc) / ARP(op=1, psrc=psrc, hwsrc=hwsrc, pdst="10.205.0.1")
+
+
+def test_packets_from_local_interfaces_are_ignored():
+    scanner = FakeScanner()
+    listener = PassiveListener(scanner)
+    listener.local_ips, listener.local_macs = {LOCAL_IP}, {LOCAL_MAC}
+    listener.handle(arp(LOCAL_IP, LOCAL_MAC))
+    # Our MAC answering for another address (e.g. proxy ARP) or another MAC claiming ours.
+    listener.handle(arp("10.205.0.7", LOCAL_MAC))
+    listener.handle(arp(LOCAL_IP, "02:00:00:00:05:07"))
+    assert scanner.observed == []
+    listener.handle(arp("10.205.0.7", "02:00:00:00:05:07"))
+    assert scanner.observed == [("10.205.0.7", "02:00:00:00:05:07")]
+    assert scanner.queued == ["10.205.0.7"]
@@ -0,0 +1,42 @@
+# tests/test_port_coverage.py
+from datetime import datetime, timedelta
+from db import save_port_results
+from port_coverage import PortCoverage, POPULAR_PORTS
+
+
+def test_window_advances_and_wraps():
+    coverage = PortCoverage(window=100)
+    ip = "10.202.0.1"
+    first = coverage.plan([ip], (1000, 1249), {}, 60, changed={})[ip]
+    assert first == list(range(1000, 1100))
+    coverage.advance([ip])
+    coverage.advance([ip])
+    third = coverage.plan([ip], (1000, 1249), {}, 60, changed={})[ip]
+    assert third == list(range(1000, 1050)) + list(range(1200, 1250))
+
+
+def test_plan_adds_known_changed_and_popular_ports():
+    coverage = PortCoverage(window=10)
+    ip = "10.202.0.2"
+    plan = coverage.plan([ip], (1, 10000), {ip: {5000}}, 60, changed={ip: {7000}})[ip]
+    assert {5000, 7000} <= set(plan)
+    assert set(POPULAR_PORTS) <= set(plan)
+    assert set(range(1, 11)) <= set(plan)
+
+
+def test_recently_changed_for_every_host():
+    ip = "10.202.0.3"
+    save_port_results({ip: ([6001], [6001])})
+    changed = PortCoverage().recently_changed(None, datetime.utcnow() - timedelta(minutes=1))
+    assert 6001 in changed[ip]
+
+
+def test_reload_picks_up_positions_advanced_elsewhere():
+    ip = "10.202.0.4"
+    parent, worker = PortCoverage(window=100), PortCoverage(window=100)
+    parent.plan([ip], (10000, 10999), {}, 60, changed={})
+    worker.plan([ip], (10000, 10999), {}, 60, changed={})
+    worker.advance([ip])
+    assert parent.plan([ip], (10000, 10999), {}, 60, changed={})[ip][0] == 10000
+    parent.reload()
+    assert parent.plan([ip], (10000, 10999), {}, 60, changed={})[ip][0] == 10100
@@ -0,0 +1,66 @@
+# tests/test_port_state.py
+from datetime import datetime
+from db import upsert_arp_results, save_port_results
+from scanner import NetworkScanner
+
+
+def add_host(ip):
+    upsert_arp_results([{'ip': ip, 'mac': "02:00:00:00:00:01", 'vendor': "Unknown"}], datetime.utcnow())
+
+
+def load_scanner():
+    scanner = NetworkScanner()
+    assert scanner.loaded.wait(10)
+    return scanner
+
+
+def test_closed_port_stays_closed_after_reload():
+    ip = "10.200.0.1"
+    add_host(ip)
+    save_port_results({ip: ([22, 80], [22, 80])})
+    save_port_results({ip: ([22, 80], [22])})
+    assert load_scanner().get_data()[ip]['ports'] == [22]
+
+
+def test_completed_scan_clears_closed_ports_in_memory():
+    ip = "10.200.0.2"
+    add_host(ip)
+    scanner = load_scanner()
+    to_save = {}
+    scanner._finish_host(to_save, ip, [22, 80], [22, 80])
+    scanner._finish_host(to_save, ip, [22, 80], [22])
+    save_port_results(to_save)
+    assert scanner.get_data()[ip]['ports'] == [22]
+    assert load_scanner().get_data()[ip]['ports'] == [22]
+
+
+def test_partial_scan_keeps_known_ports():
+    ip = "10.200.0.3"
+    add_host(ip)
+    scanner = load_scanner()
+    scanner._finish_host({}, ip, [22, 80], [22, 80])
+    # An incomplete scan only reports what it found open.
+    scanner._finish_host({}, ip, [443], [443])
+    assert scanner.get_data()[ip]['ports'] == [22, 80, 443]
+
+
+def test_discovered_scans_survive_a_failed_save(monkeypatch):
+    import scanner as scanner_module
+    ips = ["10.200.0.5", "10.200.0.6"]
+    for ip in ips:
+        add_host(ip)
+    scanner = load_scanner()
+    scanner.update_host(ips[0], port_scan_in_progress=True)
+    saved = []
+
+    def save(to_save):
+        if ips[0] in to_save:
+            raise RuntimeError("database is locked")
+        saved.append(to_save)
+
+    monkeypatch.setattr(scanner_module, 'iter_host_scans',
+                        lambda feed, **kwargs: iter([(ips[0], [22], True), (ips[1], [80], True)]))
+    monkeypatch.setattr(scanner_module, 'save_port_results', save)
+    scanner._scan_discovered(None)
+    assert saved == [{ips[1]: ([80], [80])}]
+    assert not scanner.get_host(ips[0])['port_scan_in_progress']
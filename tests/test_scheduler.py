@@ -0,0 +1,47 @@
+# tests/test_scheduler.py
+import threading
+import time
+import pytest
+from scheduler import ScanScheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+
+
+def test_interactive_work_runs_before_queued_background_work():
+    scheduler = ScanScheduler(workers=1)
+    release = threading.Event()
+    order = []
+    blocker = scheduler.submit("10.0.0.9", release.wait)
+    background = [scheduler.submit(f"10.0.0.{i}", order.append, f"background-{i}") for i in range(3)]
+    interactive = scheduler.submit("10.0.0.1", order.append, "interactive", priority=PRIORITY_INTERACTIVE)
+    release.set()
+    for future in [blocker, interactive] + background:
+        future.result(timeout=5)
+    # Same priority keeps submission order.
+    assert order == ["interactive", "background-0", "background-1", "background-2"]
+
+
+def test_per_host_limit_holds_while_other_hosts_run():
+    scheduler = ScanScheduler(workers=6, per_host_limit=2)
+    lock = threading.Lock()
+    running = {}
+    peak = {}
+
+    def work(host):
+        with lock:
+            running[host] = running.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), running[host])
+        time.sleep(0.05)
+        with lock:
+            running[host] -= 1
+
+    futures = [scheduler.submit(host, work, host, priority=PRIORITY_BACKGROUND)
+               for host in ["10.0.0.1"] * 6 + ["10.0.0.2"] * 2]
+    for future in futures:
+        future.result(timeout=5)
+    assert peak == {"10.0.0.1": 2, "10.0.0.2": 2}
+
+
+def test_errors_reach_the_future():
+    scheduler = ScanScheduler(workers=1)
+    future = scheduler.submit("10.0.0.1", int, "not a number")
+    with pytest.raises(ValueError):
+        future.result(timeout=5)
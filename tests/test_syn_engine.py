@@ -0,0 +1,104 @@
+# tests/test_syn_engine.py
+import queue
+import socket
+import struct
+from congestion import HostConditions, RateLimiter
+from syn_engine import SynScanEngine, build_tcp_segment, parse_tcp_reply, TCP_SYN, TCP_RST, TCP_ACK
+
+LOCAL = "10.0.0.254"
+
+
+def ip_packet(src, dst, segment):
+    header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(segment), 0, 0, 64, socket.IPPROTO_TCP, 0,
+                         socket.inet_aton(src), socket.inet_aton(dst))
+    return header + segment
+
+
+class FakeTransport:
+    """
+    Answers SYN probes like a host would: SYN-ACK from open ports, RST from
+    the rest. The first probe to each port in drop_first goes unanswered.
+    """
+    def __init__(self, open_ports, drop_first=()):
+        self.open_ports = open_ports  # ip -> set of ports
+        self.drop_first = set(drop_first)  # (ip, port)
+        self.probes = []  # (ip, port) of every SYN sent
+        self.replies = queue.Queue()
+
+    def source_for(self, dst):
+        return LOCAL
+
+    def send(self, dst, segment):
+        sport, dport, seq, _, _, flags = struct.unpack("!HHIIBB", segment[:14])
+        if flags != TCP_SYN:
+            return
+        self.probes.append((dst, dport))
+        if (dst, dport) in self.drop_first:
+            self.drop_first.discard((dst, dport))
+            return
+        reply_flags = TCP_SYN | TCP_ACK if dport in self.open_ports.get(dst, ()) else TCP_RST | TCP_ACK
+        reply = build_tcp_segment(dst, LOCAL, dport, sport, 0, reply_flags, ack=(seq + 1) & 0xFFFFFFFF)
+        self.replies.put(ip_packet(dst, LOCAL, reply))
+
+    def recv(self):
+        try:
+            return self.replies.get(timeout=0.05)
+        except queue.Empty:
+            return None
+
+
+def make_engine(transport, retries=2):
+    return SynScanEngine(retries=retries, transport=transport, rate_limiter=RateLimiter(0),
+                         conditions=HostConditions())
+
+
+def test_segment_round_trip():
+    segment = build_tcp_segment("10.0.0.1", "10.0.0.2", 40000, 80, 123456, TCP_SYN | TCP_ACK, ack=99)
+    assert len(segment) == 20
+    assert parse_tcp_reply(ip_packet("10.0.0.1", "10.0.0.2", segment)) == \
+        ("10.0.0.1", 40000, 80, 123456, 99, TCP_SYN | TCP_ACK)
+
+
+def test_parse_ignores_non_tcp():
+    packet = bytearray(ip_packet("10.0.0.1", "10.0.0.2", b"\0" * 20))
+    packet[9] = socket.IPPROTO_UDP
+    assert parse_tcp_reply(bytes(packet)) is None
+    assert parse_tcp_reply(b"\x45\0") is None
+
+
+def test_cookie_is_keyed_per_probe():
+    engine = make_engine(FakeTransport({}))
+    cookie = engine.cookie("10.0.0.1", 80, 40000)
+    assert cookie == engine.cookie("10.0.0.1", 80, 40000)
+    assert cookie != engine.cookie("10.0.0.1", 81, 40000)
+    assert cookie != engine.cookie("10.0.0.2", 80, 40000)
+    assert cookie != make_engine(FakeTransport({})).cookie("10.0.0.1", 80, 40000)
+
+
+def test_reply_with_a_wrong_cookie_is_ignored():
+    transport = FakeTransport({"10.0.0.1": {22}})
+    engine = make_engine(transport, retries=0)
+    forged = build_tcp_segment("10.0.0.1", LOCAL, 22, 40000, 0, TCP_SYN | TCP_ACK, ack=1)
+    transport.replies.put(ip_packet("10.0.0.1", LOCAL, forged))
+    transport.open_ports = {}
+    assert engine.scan({"10.0.0.1": [22]}, timeout=0.2) == {"10.0.0.1": []}
+
+
+def test_finds_open_ports():
+    transport = FakeTransport({"10.0.0.1": {22, 80}, "10.0.0.2": {443}})
+    engine = make_engine(transport)
+    found = engine.scan({"10.0.0.1": range(1, 101), "10.0.0.2": [80, 443]}, timeout=0.5)
+    assert found == {"10.0.0.1": [22, 80], "10.0.0.2": [443]}
+    # Every probe was answered on the first round.
+    assert len(transport.probes) == 102
+
+
+def test_retransmits_only_unanswered_probes():
+    transport = FakeTransport({"10.0.0.1": {22}}, drop_first=[("10.0.0.1", 22), ("10.0.0.1", 25)])
+    engine = make_engine(transport)
+    found = engine.scan({"10.0.0.1": [21, 22, 23, 25]}, timeout=0.2)
+    assert found == {"10.0.0.1": [22]}
+    assert sorted(transport.probes[4:]) == [("10.0.0.1", 22), ("10.0.0.1", 25)]
+    assert len(transport.probes) == 6
+    # Answers to retransmissions show the host dropped the first probes.
+    assert engine.conditions.hosts["10.0.0.1"].rate is not None